@@ -1,30 +1,98 @@
-from django.contrib import admin
-from .models import Project, Contributor, Issue, Comment
+from django import forms
+from django.contrib import admin, messages
+from django.http import HttpResponseRedirect
+from softdesksupport.pagination import EstimatedCountPaginator
+from .models import Project, Contributor, Issue, Comment, StaleObjectError
+from . import sharding
+
+
+class PerformanceAdmin(admin.ModelAdmin):
+    """
+    Defaults for changelists of large tables:
+    - estimated row count, no second COUNT(*) for the unfiltered total
+    - foreign keys edited with autocomplete widgets instead of full <select>
+    - case-sensitive prefix searches (``__startswith``) on indexed columns: unlike
+      ``^`` (istartswith, ``UPPER(col) LIKE``) or icontains they are served by the
+      index (PostgreSQL adds a ``varchar_pattern_ops`` one for indexed varchar columns)
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_object(self, request, object_id, from_field=None):
+        obj = super().get_object(request, object_id, from_field)
+        # Changelists only list the default shard, but any row can be opened (projects.sharding)
+        if obj is None and from_field is None and sharding.is_sharded() and str(object_id).isdigit():
+            alias = sharding.locate(self.model, object_id)
+            # No join: users live on the default database
+            obj = self.get_queryset(request).select_related(None).using(alias).filter(pk=object_id).first()
+        return obj
 
 
 @admin.register(Project)
-class ProjectAdmin(admin.ModelAdmin):
+class ProjectAdmin(PerformanceAdmin):
     list_display = ('name', 'type', 'author', 'created_time')
     list_filter = ('type', 'created_time')
-    search_fields = ('name', 'description')
+    list_select_related = ('author',)
+    autocomplete_fields = ('author',)
+    search_fields = ('name__startswith',)
 
 
 @admin.register(Contributor)
-class ContributorAdmin(admin.ModelAdmin):
+class ContributorAdmin(PerformanceAdmin):
     list_display = ('user', 'project', 'created_time')
     list_filter = ('created_time',)
-    search_fields = ('user__username', 'project__name')
+    list_select_related = ('user', 'project')
+    autocomplete_fields = ('user', 'project')
+    search_fields = ('user__username__startswith', 'project__name__startswith')
+
+
+class IssueAdminForm(forms.ModelForm):
+    # Version shown to the editor, checked by Issue.save() (optimistic locking)
+    loaded_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk is not None:
+            self.fields['loaded_version'].initial = self.instance.version
 
 
 @admin.register(Issue)
-class IssueAdmin(admin.ModelAdmin):
+class IssueAdmin(PerformanceAdmin):
+    form = IssueAdminForm
     list_display = ('name', 'project', 'priority', 'tag', 'status', 'author', 'assignee', 'created_time')
-    list_filter = ('priority', 'tag', 'status', 'created_time')
-    search_fields = ('name', 'description', 'project__name')
+    list_filter = ('priority', 'tag', 'status', 'created_time', ('archived_time', admin.EmptyFieldListFilter))
+    list_select_related = ('project', 'author', 'assignee')
+    autocomplete_fields = ('project', 'author', 'assignee')
+    search_fields = ('name__startswith', 'project__name__startswith')
+
+    def get_queryset(self, request):
+        # Show archived issues too, the default manager hides them.
+        # Joined here rather than by the changelist so autocomplete results
+        # (Issue.__str__ reads the project name) get the join as well
+        return Issue.all_objects.select_related(*self.list_select_related)
+
+    def save_model(self, request, obj, form, change):
+        if change and form.cleaned_data.get('loaded_version') is not None:
+            obj.version = form.cleaned_data['loaded_version']
+        super().save_model(request, obj, form, change)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except StaleObjectError:
+            self.message_user(request, "The issue was modified by someone else in the meantime, "
+                                       "your changes were not saved. Review it and retry.", messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(PerformanceAdmin):
     list_display = ('id', 'issue', 'author', 'created_time')
-    list_filter = ('created_time',)
-    search_fields = ('description', 'issue__name')
+    list_filter = ('created_time', ('archived_time', admin.EmptyFieldListFilter))
+    list_select_related = ('issue__project', 'author')
+    autocomplete_fields = ('issue', 'author')
+    search_fields = ('=id', 'issue__name__startswith')
+
+    def get_queryset(self, request):
+        return Comment.all_objects.all()
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from projects.models import Comment, Issue
+from projects.sharding import get_shards
+
+
+class Command(BaseCommand):
+    """
+    Archive finished issues, and their comments, older than N days.
+
+    Archived rows stay in their tables but are hidden by the default
+    managers; use ``Issue.all_objects`` / ``Comment.all_objects`` or the
+    ``?archived=true`` query parameter of the API to read them.
+    """
+
+    help = "Archive finished issues (and their comments) untouched for N days."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90,
+                            help="Archive issues finished more than DAYS days ago (default: 90).")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Number of issues archived per transaction (default: 500).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report how many issues would be archived.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+
+        if options['dry_run']:
+            count = sum(self.candidates(alias, cutoff).count() for alias in get_shards())
+            self.stdout.write(f"{count} issue(s) would be archived.")
+            return
+
+        archived_issues = archived_comments = 0
+        for alias in get_shards():
+            candidates = self.candidates(alias, cutoff)
+            while True:
+                with transaction.atomic(using=alias):
+                    ids = list(candidates.order_by('pk').values_list('pk', flat=True)[:batch_size])
+                    if not ids:
+                        break
+                    now = timezone.now()
+                    archived_comments += Comment.objects.using(alias).filter(issue_id__in=ids).update(archived_time=now)
+                    archived_issues += Issue.objects.using(alias).filter(pk__in=ids).update(archived_time=now)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived_issues} issue(s) and {archived_comments} comment(s)."
+        ))
+
+    def candidates(self, alias, cutoff):
+        """Issues of the shard ``alias`` to archive."""
+        return Issue.objects.using(alias).filter(status='Finished', updated_time__lt=cutoff)
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+from projects.models import Issue, IssueDailyRollup
+from projects.sharding import get_shards
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the daily issue rollups from the Issue table (archived issues included).
+
+    Issues are counted as opened on their creation day, and finished issues
+    as finished on the day of their ``finished_time``.
+    """
+
+    help = "Rebuild IssueDailyRollup from the issues, for all projects or the given ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project', type=int, action='append', dest='projects',
+                            help="Only rebuild this project (can be repeated).")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Rollup rows inserted per query (default: 1000).")
+
+    def handle(self, *args, **options):
+        total = sum(self.rebuild(alias, options) for alias in get_shards())
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total} daily rollup(s)."))
+
+    def rebuild(self, alias, options):
+        """Rebuild the rollups of the shard ``alias``, return the number of rollups."""
+        issues = Issue.all_objects.using(alias)
+        rollups = IssueDailyRollup.objects.using(alias)
+        if options['projects']:
+            issues = issues.filter(project__in=options['projects'])
+            rollups = rollups.filter(project__in=options['projects'])
+
+        buckets = {}
+        opened = (issues.annotate(day=TruncDate('created_time'))
+                  .values('project', 'day', 'priority', 'tag').annotate(count=Count('id')).order_by())
+        finished = (issues.filter(finished_time__isnull=False).annotate(day=TruncDate('finished_time'))
+                    .values('project', 'day', 'priority', 'tag').annotate(count=Count('id')).order_by())
+        for counter, rows in (('opened', opened), ('finished', finished)):
+            for row in rows.iterator():
+                key = (row['project'], row['day'], row['priority'], row['tag'])
+                bucket = buckets.setdefault(key, IssueDailyRollup(
+                    project_id=key[0], day=key[1], priority=key[2], tag=key[3]))
+                setattr(bucket, counter, row['count'])
+
+        with transaction.atomic(using=alias):
+            rollups.delete()
+            IssueDailyRollup.objects.using(alias).bulk_create(buckets.values(), batch_size=options['batch_size'])
+        return len(buckets)
@@ -0,0 +1,81 @@
+import timeit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+from softdesksupport.renderers import FastJSONRenderer, orjson
+from softdesksupport.middleware import brotli
+
+
+class Command(BaseCommand):
+    """
+    Measure bandwidth and CPU cost per response for each JSON renderer
+    and content encoding, on a synthetic page of issues.
+    """
+
+    help = "Benchmark JSON renderers and response compression on a synthetic issue page."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=settings.REST_FRAMEWORK.get('PAGE_SIZE', 10),
+                            help="Issues per page (default: PAGE_SIZE).")
+        parser.add_argument('--description-size', type=int, default=2000,
+                            help="Characters in each issue description (default: 2000).")
+        parser.add_argument('--repeat', type=int, default=200,
+                            help="Iterations per measurement (default: 200).")
+
+    def handle(self, *args, **options):
+        page = self.build_page(options['items'], options['description_size'])
+        repeat = options['repeat']
+
+        renderers = [('json', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('orjson', FastJSONRenderer()))
+        else:
+            self.stdout.write("orjson is not installed, FastJSONRenderer falls back to json.")
+
+        encoders = [('identity', lambda content: content),
+                    ('gzip', lambda content: compress_string(content))]
+        if brotli is not None:
+            quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+            encoders.append(('br', lambda content: brotli.compress(content, quality=quality)))
+        else:
+            self.stdout.write("brotli is not installed, only gzip is benchmarked.")
+
+        self.stdout.write(f"{'renderer':<10}{'encoding':<10}{'bytes':>10}{'render µs':>12}{'encode µs':>12}{'total µs':>12}")
+        for renderer_name, renderer in renderers:
+            render_us = self.time_us(lambda: renderer.render(page), repeat)
+            content = renderer.render(page)
+            for encoding_name, encode in encoders:
+                encode_us = self.time_us(lambda: encode(content), repeat)
+                self.stdout.write(
+                    f"{renderer_name:<10}{encoding_name:<10}{len(encode(content)):>10}"
+                    f"{render_us:>12.1f}{encode_us:>12.1f}{render_us + encode_us:>12.1f}"
+                )
+
+    @staticmethod
+    def time_us(func, repeat):
+        """Average duration of ``func`` in microseconds."""
+        return timeit.timeit(func, number=repeat) / repeat * 1e6
+
+    @staticmethod
+    def build_page(items, description_size):
+        """Paginated payload shaped like GET /api/issues/."""
+        created_time = timezone.now().isoformat()
+        sentence = "Stack trace line: File \"views.py\", line 42, in get_queryset\n"
+        description = (sentence * (description_size // len(sentence) + 1))[:description_size]
+        return {
+            'count': items,
+            'next': None,
+            'previous': None,
+            'results': [
+                {
+                    'id': pk, 'name': f"Issue {pk}", 'description': description,
+                    'priority': 'MEDIUM', 'tag': 'BUG', 'status': 'To Do',
+                    'project': 1, 'author': 1, 'assignee': None, 'created_time': created_time,
+                }
+                for pk in range(1, items + 1)
+            ],
+        }
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from projects.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    """
+    Delete the stored responses of Idempotency-Key requests older than
+    ``IDEMPOTENCY_KEY_TTL`` seconds. Expired keys are already ignored by the
+    API, this only keeps the table small; run it e.g. hourly.
+    """
+
+    help = "Delete expired Idempotency-Key records."
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        deleted, _ = IdempotencyKey.objects.filter(created_time__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency key(s)."))
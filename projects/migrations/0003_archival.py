@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:31
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_created_time(apps, schema_editor):
+    """Existing issues were last updated at their creation, as far as we know, not at the migration."""
+    Issue = apps.get_model('projects', 'Issue')
+    Issue._base_manager.using(schema_editor.connection.alias).update(updated_time=F('created_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_alter_comment_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='archived_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='archived_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='updated_time',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(copy_created_time, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['status', 'updated_time'], name='issue_status_updated_idx'),
+        ),
+    ]
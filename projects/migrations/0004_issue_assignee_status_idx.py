@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0003_archival'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['assignee', 'status', 'priority'], name='issue_assignee_status_idx'),
+        ),
+    ]
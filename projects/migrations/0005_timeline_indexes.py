@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_issue_assignee_status_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contributor',
+            index=models.Index(fields=['project', 'created_time'], name='contributor_project_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['project', 'created_time'], name='issue_project_time_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0005_timeline_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IssueDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('priority', models.CharField(choices=[('LOW', 'Low'), ('MEDIUM', 'Medium'), ('HIGH', 'High')], max_length=10)),
+                ('tag', models.CharField(choices=[('BUG', 'Bug'), ('FEATURE', 'Feature'), ('TASK', 'Task')], max_length=10)),
+                ('opened', models.PositiveIntegerField(default=0)),
+                ('finished', models.PositiveIntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='projects.project')),
+            ],
+            options={
+                'unique_together': {('project', 'day', 'priority', 'tag')},
+            },
+        ),
+    ]
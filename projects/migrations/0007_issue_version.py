@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0006_issuedailyrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, router
+
+
+def seed_tickets(apps, schema_editor):
+    """Start the ID tickets above the IDs of the existing projects, contributors, issues and comments."""
+    from projects.sharding import seed_tickets
+
+    IdTicket = apps.get_model('projects', 'IdTicket')
+    alias = schema_editor.connection.alias
+    if not router.allow_migrate_model(alias, IdTicket):
+        return
+    models = [apps.get_model('projects', name) for name in ('Project', 'Contributor', 'Issue', 'Comment')]
+    seed_tickets(IdTicket, models, [alias])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0009_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_tickets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_issue_project(apps, schema_editor):
+    """Fill the project of the existing comments from their issue."""
+    Comment = apps.get_model('projects', 'Comment')
+    Issue = apps.get_model('projects', 'Issue')
+    alias = schema_editor.connection.alias
+    Comment._base_manager.using(alias).update(
+        project=Subquery(Issue._base_manager.using(alias).filter(pk=OuterRef('issue')).values('project')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0010_seed_id_tickets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='project',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='comments', to='projects.project'),
+        ),
+        migrations.RunPython(copy_issue_project, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='comment',
+            name='project',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='comments', to='projects.project'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['project', 'created_time'], name='comment_project_time_idx'),
+        ),
+    ]
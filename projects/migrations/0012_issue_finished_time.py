@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:10
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_updated_time(apps, schema_editor):
+    """Finished issues were finished at their last update at the latest, the closest record we have."""
+    Issue = apps.get_model('projects', 'Issue')
+    Issue._base_manager.using(schema_editor.connection.alias).filter(status='Finished').update(
+        finished_time=F('updated_time'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0011_comment_project'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='finished_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(copy_updated_time, migrations.RunPython.noop),
+    ]
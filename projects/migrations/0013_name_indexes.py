@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0012_issue_finished_time'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='issue',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='name',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
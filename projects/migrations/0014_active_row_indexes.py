@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0013_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('archived_time__isnull', True)), fields=['project', 'created_time'],
+                               name='issue_active_project_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('archived_time__isnull', True)),
+                               fields=['assignee', 'status', 'priority'], name='issue_active_assignee_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('archived_time__isnull', True)), fields=['issue', 'created_time'],
+                               name='comment_active_issue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('archived_time__isnull', True)), fields=['project', 'created_time'],
+                               name='comment_active_project_idx'),
+        ),
+    ]
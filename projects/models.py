@@ -1,9 +1,89 @@
 import uuid
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import DEFERRED, F, BooleanField, Exists, ExpressionWrapper, OuterRef, Q
+from django.db.models.functions import Greatest
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
 
 
-class Project(models.Model):
+class RoleQuerySet(models.QuerySet):
+    """
+    QuerySet annotating the role of a user on each row, in the same query:
+    - is_author: the user wrote the row (models with an ``author``)
+    - is_project_author: the user is the author of the row's project
+    - is_contributor: the user is a contributor of the row's project
+    Permission classes read these flags instead of querying per object.
+    """
+
+    # Lookup from the model to its Project's primary key
+    project_lookup = 'project'
+
+    def with_roles(self, user):
+        project = OuterRef(self.project_lookup)
+        roles = {
+            'is_project_author': Exists(Project.objects.filter(pk=project, author=user)),
+            'is_contributor': Exists(Contributor.objects.filter(project=project, user=user)),
+        }
+        if any(field.name == 'author' for field in self.model._meta.fields):
+            roles['is_author'] = ExpressionWrapper(Q(author=user), output_field=BooleanField())
+        return self.annotate(**roles)
+
+    def visible_to(self, user):
+        """Rows of the projects ``user`` authored or contributes to, with roles annotated."""
+        return self.with_roles(user).filter(Q(is_project_author=True) | Q(is_contributor=True))
+
+
+class ProjectQuerySet(RoleQuerySet):
+    project_lookup = 'pk'
+
+
+class CommentQuerySet(RoleQuerySet):
+    project_lookup = 'project'
+
+
+class StaleObjectError(Exception):
+    """The row was changed by someone else since it was loaded (version mismatch)."""
+
+
+class ArchivableManager(models.Manager):
+    """
+    Default manager hiding archived rows (``archived_time`` set). The hot lookups
+    are served by partial indexes of the rows not archived, which archived rows
+    do not grow.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(archived_time__isnull=True)
+
+
+class ShardedModel(models.Model):
+    """
+    Model stored on the shard of its project (projects.sharding). When sharding is
+    enabled, new rows get an ID unique across shards and are saved on that shard.
+    """
+
+    # Relation leading to the row whose shard is shared (the project, directly or not)
+    shard_parent = 'project'
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        from . import sharding
+
+        allocated = False
+        if sharding.is_sharded():
+            if self._state.adding and self.pk is None:
+                self.pk = sharding.allocate_id(self)
+                kwargs['force_insert'] = allocated = True
+            kwargs['using'] = sharding.shard_for_instance(self)
+        super().save(*args, **kwargs)
+        if allocated:
+            sharding.remember(self)
+
+
+class Project(ShardedModel):
     TYPE_CHOICES = [
         ('back-end', 'Back-end'),
         ('front-end', 'Front-end'),
@@ -11,29 +91,42 @@ class Project(models.Model):
         ('Android', 'Android'),
     ]
 
-    name = models.CharField(max_length=255)
+    # Indexed for the admin prefix search (case-sensitive, see projects.admin)
+    name = models.CharField(max_length=255, db_index=True)
     description = models.TextField()
     type = models.CharField(max_length=20, choices=TYPE_CHOICES)
-    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='authored_projects')
+    # Users live on the default database: no constraint across shards (projects.sharding)
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='authored_projects',
+                               db_constraint=False)
     created_time = models.DateTimeField(auto_now_add=True)
 
+    objects = ProjectQuerySet.as_manager()
+
+    shard_parent = None
+
     def __str__(self):
         return self.name
 
 
-class Contributor(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+class Contributor(ShardedModel):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_constraint=False)
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='contributors')
     created_time = models.DateTimeField(auto_now_add=True)
 
+    objects = RoleQuerySet.as_manager()
+
     class Meta:
         unique_together = ('user', 'project')
+        indexes = [
+            # Project activity timeline
+            models.Index(fields=['project', 'created_time'], name='contributor_project_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.project.name}"
 
 
-class Issue(models.Model):
+class Issue(ShardedModel):
     PRIORITY_CHOICES = [
         ('LOW', 'Low'),
         ('MEDIUM', 'Medium'),
@@ -52,26 +145,221 @@ class Issue(models.Model):
         ('Finished', 'Finished'),
     ]
 
-    name = models.CharField(max_length=255)
+    # Indexed for the admin prefix search (case-sensitive, see projects.admin)
+    name = models.CharField(max_length=255, db_index=True)
     description = models.TextField()
     priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='MEDIUM')
     tag = models.CharField(max_length=10, choices=TAG_CHOICES)
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='To Do')
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='issues')
-    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='authored_issues')
-    assignee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_issues')
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='authored_issues',
+                               db_constraint=False)
+    assignee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_issues',
+                                 db_constraint=False)
     created_time = models.DateTimeField(auto_now_add=True)
+    updated_time = models.DateTimeField(auto_now=True)
+    archived_time = models.DateTimeField(null=True, blank=True, editable=False)
+    # When the status last became Finished, cleared on reopen (set by save())
+    finished_time = models.DateTimeField(null=True, blank=True, editable=False)
+    # Optimistic locking: incremented by every save, see save()
+    version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Archived issues are hidden by default, use all_objects to reach them
+    objects = ArchivableManager.from_queryset(RoleQuerySet)()
+    all_objects = RoleQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_time'], name='issue_status_updated_idx'),
+            # "My work": open issues assigned to a user
+            models.Index(fields=['assignee', 'status', 'priority'], name='issue_assignee_status_idx'),
+            # Project activity timeline
+            models.Index(fields=['project', 'created_time'], name='issue_project_time_idx'),
+            # Lookups of the default manager, which hides archived issues: the index skips them
+            models.Index(fields=['project', 'created_time'], condition=Q(archived_time__isnull=True),
+                         name='issue_active_project_idx'),
+            models.Index(fields=['assignee', 'status', 'priority'], condition=Q(archived_time__isnull=True),
+                         name='issue_active_assignee_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Values as loaded, to detect changes (e.g. status, assignee) on save
+        instance._loaded_values = {name: value for name, value in zip(field_names, values) if value is not DEFERRED}
+        return instance
+
+    def loaded_value(self, attname, default=None):
+        """Value of ``attname`` when the issue was loaded, ``default`` for new or deferred fields."""
+        return getattr(self, '_loaded_values', {}).get(attname, default)
+
+    def save(self, *args, **kwargs):
+        """
+        Save the issue. Updates are conditional (``UPDATE ... WHERE version = <loaded version>``)
+        and raise StaleObjectError when the row changed since it was loaded.
+        """
+        deferred = self.get_deferred_fields()
+        update_fields = kwargs.get('update_fields')
+        if 'status' not in deferred and (update_fields is None or 'status' in update_fields):
+            finished_time = self.finished_time
+            if self.status != 'Finished':
+                self.finished_time = None
+            elif self.finished_time is None:
+                self.finished_time = timezone.now()
+            if self.finished_time != finished_time and update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'finished_time'}
+        versioned = not self._state.adding and 'version' not in deferred
+        if versioned:
+            self._expected_version = self.version
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        try:
+            super().save(*args, **kwargs)
+        except StaleObjectError:
+            self.version = self._expected_version
+            raise
+        finally:
+            self._expected_version = None
+        if not self._state.adding and self.loaded_value('project_id', self.project_id) != self.project_id:
+            # Comments carry the project of their issue
+            Comment.all_objects.using(self._state.db).filter(issue=self).update(project=self.project_id)
+        # post_save receivers saw the previous values, the saved ones are the reference now
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {field.attname: getattr(self, field.attname)
+                               for field in self._meta.concrete_fields if field.attname not in deferred}
+
+    def _do_update(self, base_qs, *args, **kwargs):
+        expected = getattr(self, '_expected_version', None)
+        if expected is None:
+            return super()._do_update(base_qs, *args, **kwargs)
+        if not super()._do_update(base_qs.filter(version=expected), *args, **kwargs):
+            raise StaleObjectError(f"Issue {self.pk} was modified concurrently (expected version {expected}).")
+        return True
 
     def __str__(self):
         return f"{self.name} - {self.project.name}"
 
 
-class Comment(models.Model):
+class Comment(ShardedModel):
     #id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     description = models.TextField()
     issue = models.ForeignKey(Issue, on_delete=models.CASCADE, related_name='comments')
-    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='authored_comments')
+    # Project of the issue, copied by save() so comments are read by project (timeline)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='comments', editable=False)
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='authored_comments',
+                               db_constraint=False)
     created_time = models.DateTimeField(auto_now_add=True)
+    archived_time = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ArchivableManager.from_queryset(CommentQuerySet)()
+    all_objects = CommentQuerySet.as_manager()
+
+    shard_parent = 'issue'
+
+    class Meta:
+        indexes = [
+            # Project activity timeline
+            models.Index(fields=['project', 'created_time'], name='comment_project_time_idx'),
+            # Lookups of the default manager, which hides archived comments: the index skips them
+            models.Index(fields=['issue', 'created_time'], condition=Q(archived_time__isnull=True),
+                         name='comment_active_issue_idx'),
+            models.Index(fields=['project', 'created_time'], condition=Q(archived_time__isnull=True),
+                         name='comment_active_project_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Follow the issue when it is set (new comment, or moved to another issue)
+        if self.issue_id is not None and (self.project_id is None or self._meta.get_field('issue').is_cached(self)):
+            self.project_id = self.issue.project_id
+            if kwargs.get('update_fields') is not None and 'issue' in kwargs['update_fields']:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'project'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Comment on {self.issue.name}"
+
+
+class IssueDailyRollup(models.Model):
+    """
+    Issues opened and finished per project, day, priority and tag.
+    Each existing issue (archived ones included) counts as opened on its creation
+    day and, when finished, once as finished on its ``finished_time`` day; both in
+    its current priority and tag. Maintained incrementally when issues are saved or
+    deleted (projects.signals), rebuilt with the backfill_issue_rollups command.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    priority = models.CharField(max_length=10, choices=Issue.PRIORITY_CHOICES)
+    tag = models.CharField(max_length=10, choices=Issue.TAG_CHOICES)
+    opened = models.PositiveIntegerField(default=0)
+    finished = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('project', 'day', 'priority', 'tag')
+
+    def __str__(self):
+        return f"{self.project_id} {self.day} {self.priority}/{self.tag}"
+
+    @classmethod
+    def record(cls, project_id, day, priority, tag, opened=0, finished=0, using=None):
+        """
+        Add ``opened`` / ``finished`` to a bucket (in database ``using``), creating it if needed.
+        Negative values subtract, counters do not go below 0.
+        """
+        rollups = cls.objects.db_manager(using)
+        bucket = rollups.filter(project_id=project_id, day=day, priority=priority, tag=tag)
+        increments = {'opened': Greatest(F('opened') + opened, 0), 'finished': Greatest(F('finished') + finished, 0)}
+        if bucket.update(**increments) or (opened <= 0 and finished <= 0):
+            return
+        try:
+            with transaction.atomic(using=using):
+                rollups.create(project_id=project_id, day=day, priority=priority, tag=tag,
+                               opened=max(opened, 0), finished=max(finished, 0))
+        except IntegrityError:
+            # Created concurrently in the meantime
+            bucket.update(**increments)
+
+
+class IdTicket(models.Model):
+    """
+    Ticket table of the sharded models (projects.sharding), on the default database:
+    each row hands out one ID unique across shards. Old tickets are deleted,
+    their IDs are never reused. Tickets start above the IDs of the rows created
+    before sharding (projects.sharding.seed_tickets).
+    """
+
+
+class ProjectDirectory(models.Model):
+    """Global directory, on the default database: the shard holding each project and its rows."""
+    project_id = models.BigIntegerField(primary_key=True)
+    shard = models.CharField(max_length=100)
+    created_time = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'project directory'
+
+    def __str__(self):
+        return f"Project {self.project_id} on {self.shard}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    First response of a POST sent with an ``Idempotency-Key`` header, replayed to
+    its retries for ``IDEMPOTENCY_KEY_TTL`` seconds (projects.views.IdempotentCreateMixin).
+    Rows without a status code belong to requests still running.
+    Expired rows are deleted by the purge_idempotency_keys command.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=32)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    location = models.CharField(max_length=2000, blank=True)
+    created_time = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.user_id} {self.key}"
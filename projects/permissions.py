@@ -36,6 +36,16 @@ from projects.models import Contributor, Issue, Project
 from rest_framework import permissions
 
 
+def get_role(obj, flag, compute):
+    """
+    Return the role flag annotated on obj by RoleQuerySet.with_roles()
+    (is_author, is_project_author, is_contributor), or compute() it when
+    the object was loaded without annotations.
+    """
+    value = getattr(obj, flag, None)
+    return compute() if value is None else value
+
+
 class ContributorPermission(permissions.BasePermission):
     """
     Permissions for managing project contributors.
@@ -50,9 +60,9 @@ class ContributorPermission(permissions.BasePermission):
         if request.user.is_staff:
             return True
         
-        # Others can read (we added IsAuthenticated in the view)
+        # Others can read, lists are scoped by get_queryset() (RoleQuerySet.visible_to)
         if request.method in permissions.SAFE_METHODS:
-            return None
+            return True
         
         return False
     
@@ -68,11 +78,12 @@ class ContributorPermission(permissions.BasePermission):
             False otherwise
         """
         # Project author can do anything
-        if request.user == obj.project.author:
+        if get_role(obj, 'is_project_author', lambda: obj.project.author_id == request.user.pk):
             return True
         
         # Project members can read only
-        is_proj_member = obj.project.contributors.filter(user=request.user).exists()
+        is_proj_member = get_role(obj, 'is_contributor',
+                                  lambda: obj.project.contributors.filter(user=request.user).exists())
         
         if is_proj_member and request.method in permissions.SAFE_METHODS:
             return True
@@ -93,16 +104,16 @@ class ProjectPermission(permissions.BasePermission):
         """
         Check if user can access the list/create endpoint.
         
-        Staff can do anything. GET requests deferred to IsAuthenticated.
+        Staff can do anything. GET requests allowed, get_queryset() only returns the user's projects.
         POST requests allowed for authenticated users (detail check in has_object_permission).
         """
         # Staff can do anything
         if request.user.is_staff:
             return True
         
-        # Others can read (we added IsAuthenticated permission in the view)
+        # Others can read, lists are scoped by get_queryset() (RoleQuerySet.visible_to)
         if request.method in permissions.SAFE_METHODS:
-            return None
+            return True
         
         if request.method == "POST":
             return True
@@ -121,7 +132,7 @@ class ProjectPermission(permissions.BasePermission):
             False for all other cases
         """
         # Project author can do anything
-        if request.user == obj.author:
+        if obj.author_id == request.user.pk:
             return True
         
         # Contributors can only read
@@ -144,16 +155,16 @@ class CommentPermission(permissions.BasePermission):
         """
         Check if user can access the list/create endpoint.
         
-        Staff can do anything. GET requests deferred to IsAuthenticated.
+        Staff can do anything. GET requests allowed, get_queryset() only returns the user's projects.
         POST requests allowed for authenticated users (detail check in has_object_permission).
         """
         # Staff can do anything
         if request.user.is_staff:
             return True
         
-        # Others can read (we added IsAuthenticated in the view)
+        # Others can read, lists are scoped by get_queryset() (RoleQuerySet.visible_to)
         if request.method in permissions.SAFE_METHODS:
-            return None
+            return True
         
         return True # Filtered further in has_object_permission
     
@@ -169,12 +180,13 @@ class CommentPermission(permissions.BasePermission):
             False otherwise
         """
         # Comment author can do everything
-        if request.user == obj.author:
+        if obj.author_id == request.user.pk:
             return True
         
         # Project members can read only
-        is_author = obj.issue.project.author == request.user
-        is_contributor = obj.issue.project.contributors.filter(user=request.user).exists()
+        is_author = get_role(obj, 'is_project_author', lambda: obj.issue.project.author_id == request.user.pk)
+        is_contributor = get_role(obj, 'is_contributor',
+                                  lambda: obj.issue.project.contributors.filter(user=request.user).exists())
         if is_author or is_contributor:
             return request.method in permissions.SAFE_METHODS
     
@@ -194,16 +206,16 @@ class IssuePermission(permissions.BasePermission):
         """
         Check if user can access the list/create endpoint.
         
-        Staff can do anything. GET requests deferred to IsAuthenticated.
+        Staff can do anything. GET requests allowed, get_queryset() only returns the user's projects.
         POST/PUT/DELETE requests allowed for authenticated users (detail check in has_object_permission).
         """
         # Staff can do anything
         if request.user.is_staff:
             return True
         
-        # Others can read (we added IsAuthenticated in the view)
+        # Others can read, lists are scoped by get_queryset() (RoleQuerySet.visible_to)
         if request.method in permissions.SAFE_METHODS:
-            return None
+            return True
         
         if request.method == "POST":
             # Allow Issue creation for every authenticated user
@@ -224,10 +236,11 @@ class IssuePermission(permissions.BasePermission):
             False otherwise
         """
         # Issue author can do everything
-        if request.user == obj.author:
+        if obj.author_id == request.user.pk:
             return True
         
-        is_contributor = obj.project.contributors.filter(user=request.user).exists()
+        is_contributor = get_role(obj, 'is_contributor',
+                                  lambda: obj.project.contributors.filter(user=request.user).exists())
         if is_contributor:
             return request.method in permissions.SAFE_METHODS
         
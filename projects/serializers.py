@@ -1,54 +1,329 @@
-from rest_framework import serializers
-from .models import Project, Contributor, Issue, Comment
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models, transaction
+from django.db.models.functions import Length, Substr
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.validators import UniqueTogetherValidator
+from .models import Project, Contributor, Issue, Comment, StaleObjectError
+from . import sharding
+from users.serializers import UserCompactSerializer
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+def parse_list_param(request, name):
+    """Return the comma separated values of query parameter ``name`` as a list (order kept)."""
+    raw = request.query_params.get(name, '') if request is not None else ''
+    return list(dict.fromkeys(value.strip() for value in raw.split(',') if value.strip()))
+
+
+def is_preview_request(view):
+    """
+    True for list requests, which return a preview of the large text fields
+    instead of their full content, unless ``?full_text=true`` is passed.
+    """
+    if view is None or getattr(view, 'action', None) != 'list':
+        return False
+    return view.request.query_params.get('full_text', '').lower() not in ('1', 'true', 'yes')
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin for sparse fieldsets and expansion of related objects.
+    - ``?fields=id,name`` only serializes the listed fields
+    - ``?expand=author,project`` inlines the related objects listed in ``expandable_fields``
+    - On lists, each of ``preview_fields`` is replaced by ``<name>_preview``
+      (first DESCRIPTION_PREVIEW_LENGTH characters) and ``<name>_length``,
+      in expanded objects too; ``?fields=description`` selects both
+    - Only applied on read requests, writes always use the full serializer
+    """
+
+    # field name -> serializer class used to inline the related object
+    expandable_fields = {}
+    # large text fields, only sent in full on retrieve
+    preview_fields = ()
+
+    def __init__(self, *args, preview=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Expanded serializers get ``preview`` from their parent, they have no context yet
+        self.preview = preview
+        if preview:
+            self.use_previews()
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        if is_preview_request(self.context.get('view')):
+            self.use_previews()
+
+        fields = self.get_requested_fields(request, self.preview)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+        for name in self.get_expanded_fields(request, self.fields):
+            serializer_class = self.expandable_fields[name]
+            options = {'preview': True} if self.preview and issubclass(serializer_class, DynamicFieldsMixin) else {}
+            self.fields[name] = serializer_class(read_only=True, **options)
+
+    def use_previews(self):
+        self.preview = True
+        for name in self.preview_fields:
+            if self.fields.pop(name, None) is not None:
+                self.fields[f'{name}_preview'] = serializers.CharField(read_only=True)
+                self.fields[f'{name}_length'] = serializers.IntegerField(read_only=True)
+
+    def to_representation(self, instance):
+        for name, field in self.fields.items():
+            related = getattr(instance, name, None) if isinstance(field, DynamicFieldsMixin) and field.preview else None
+            if related is None:
+                continue
+            # Previews of expanded objects are annotated on this row, see optimize_queryset()
+            for text in field.preview_fields:
+                for suffix in ('preview', 'length'):
+                    if hasattr(instance, f'{name}_{text}_{suffix}'):
+                        setattr(related, f'{text}_{suffix}', getattr(instance, f'{name}_{text}_{suffix}'))
+        if self.preview:
+            deferred = instance.get_deferred_fields()
+            for text in self.preview_fields:
+                wanted = f'{text}_preview' in self.fields or f'{text}_length' in self.fields
+                if wanted and text not in deferred and not hasattr(instance, f'{text}_preview'):
+                    # Not from optimize_queryset(): cut the loaded text
+                    value = getattr(instance, text)
+                    instance.__dict__[f'{text}_preview'] = value[:settings.DESCRIPTION_PREVIEW_LENGTH]
+                    instance.__dict__[f'{text}_length'] = len(value)
+        return super().to_representation(instance)
+
+    @classmethod
+    def get_requested_fields(cls, request, preview=False):
+        """Values of ``?fields=``; on previews, a large text field stands for its preview and length."""
+        fields = parse_list_param(request, 'fields')
+        if preview:
+            fields = [alias for name in fields
+                      for alias in ((f'{name}_preview', f'{name}_length') if name in cls.preview_fields else (name,))]
+        return fields
+
+    @classmethod
+    def get_expanded_fields(cls, request, available):
+        """Return the requested expansions which exist in ``available`` fields."""
+        return [name for name in parse_list_param(request, 'expand')
+                if name in cls.expandable_fields and name in available]
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request, preview=False):
+        """
+        Trim the SELECT to the requested fields and join expanded relations.
+        Foreign keys (used by permission checks) and created_time (used for
+        ordering and cursor pagination) are always loaded, they are cheap.
+        With ``preview``, the large text fields are not loaded, of this model
+        and of the joined ones: their preview and length are computed by the database.
+        """
+        model = cls.Meta.model
+        fields = cls.get_requested_fields(request, preview)
+        available = fields or cls.Meta.fields
+        deferred = cls.preview_fields if preview else ()
+
+        if fields:
+            columns = {field.name for field in model._meta.concrete_fields
+                       if (field.name in fields and field.name not in deferred)
+                       or field.is_relation or field.name == 'created_time'}
+            queryset = queryset.only('pk', *columns)
+        elif deferred:
+            queryset = queryset.defer(*deferred)
+
+        for name in deferred:
+            if not fields or f'{name}_preview' in fields:
+                queryset = queryset.annotate(**{
+                    f'{name}_preview': Substr(name, 1, settings.DESCRIPTION_PREVIEW_LENGTH)})
+            if not fields or f'{name}_length' in fields:
+                queryset = queryset.annotate(**{f'{name}_length': Length(name)})
+
+        expanded = cls.get_expanded_fields(request, available)
+        if sharding.is_sharded():
+            # Users are on the default database, they cannot be joined from a shard
+            users = [name for name in expanded if not sharding.is_sharded_model(model._meta.get_field(name).related_model)]
+            queryset = queryset.prefetch_related(*users)
+            expanded = [name for name in expanded if name not in users]
+        if expanded:
+            queryset = queryset.select_related(*expanded)
+        for name in expanded if preview else ():
+            serializer_class = cls.expandable_fields[name]
+            for text in getattr(serializer_class, 'preview_fields', ()):
+                column = f'{name}__{text}'
+                queryset = queryset.defer(column).annotate(**{
+                    f'{name}_{text}_preview': Substr(column, 1, settings.DESCRIPTION_PREVIEW_LENGTH),
+                    f'{name}_{text}_length': Length(column),
+                })
+        return queryset
+
+
+class ShardedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key relation looked up on the shard of the related row (projects.sharding).
+    A saved row cannot be related to a row of another shard: rows are not moved across shards.
+    """
+
+    default_error_messages = {
+        'other_shard': 'Invalid pk "{pk_value}" - object is stored on another shard, rows cannot be moved there.',
+    }
+
+    def to_internal_value(self, data):
+        queryset = self.get_queryset()
+        if self.pk_field is not None or not sharding.is_sharded():
+            return super().to_internal_value(data)
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            related = queryset.using(sharding.locate(queryset.model, data)).get(pk=data)
+        except ObjectDoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        instance = getattr(self.parent, 'instance', None)
+        if (sharding.is_sharded_model(queryset.model) and isinstance(instance, models.Model)
+                and not instance._state.adding and related._state.db != instance._state.db):
+            self.fail('other_shard', pk_value=data)
+        return related
+
+
+class ShardedUniqueTogetherValidator(UniqueTogetherValidator):
+    """UniqueTogetherValidator checking on the shard of the project (projects.sharding)."""
+
+    def filter_queryset(self, attrs, queryset, serializer):
+        project = attrs.get('project') or getattr(serializer.instance, 'project', None)
+        if project is not None and sharding.is_sharded():
+            queryset = queryset.using(sharding.shard_for_instance(project))
+        return super().filter_queryset(attrs, queryset, serializer)
+
+
+class Conflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The object was modified by someone else, reload it and retry.'
+    default_code = 'conflict'
+
+
+class MinimalUpdateMixin:
+    """
+    ModelSerializer mixin for PUT/PATCH:
+    - only the fields whose value changed are written (``save(update_fields=...)``)
+    - for versioned models, the ``version`` sent by the client (body or
+      ``If-Match`` header) must match the stored one, and concurrent writes
+      are answered with 409 Conflict instead of being lost
+    """
+
+    def update(self, instance, validated_data):
+        self.check_version(instance)
+
+        changed = []
+        for name, value in validated_data.items():
+            field = instance._meta.get_field(name)
+            if field.is_relation:
+                current, value_id = getattr(instance, field.attname), getattr(value, 'pk', None)
+                if current != value_id:
+                    setattr(instance, name, value)
+                    changed.append(name)
+            elif getattr(instance, name) != value:
+                setattr(instance, name, value)
+                changed.append(name)
+
+        if not changed:
+            return instance
+
+        # auto_now fields are only refreshed when part of update_fields
+        changed += [field.name for field in instance._meta.concrete_fields if getattr(field, 'auto_now', False)]
+        try:
+            # Own savepoint: a conflict leaves an enclosing transaction usable
+            with transaction.atomic(using=instance._state.db):
+                instance.save(update_fields=changed)
+        except StaleObjectError:
+            raise Conflict()
+        return instance
+
+    def check_version(self, instance):
+        """Raise Conflict if the client edited an older version than the stored one."""
+        if not hasattr(instance, 'version'):
+            return
+        expected = self.initial_data.get('version')
+        request = self.context.get('request')
+        if expected is None and request is not None:
+            expected = request.headers.get('If-Match', '').removeprefix('W/').strip('"') or None
+        if expected is None:
+            return
+        try:
+            expected = int(expected)
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({'version': 'A valid integer is required.'})
+        if expected != instance.version:
+            raise Conflict()
+
+
+class ProjectSerializer(MinimalUpdateMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Project model.
     - Only exposes public fields
     - author is read-only and auto-set during creation
     """
 
+    expandable_fields = {'author': UserCompactSerializer}
+    preview_fields = ('description',)
+
     class Meta:
         model = Project
         fields = ['id', 'name', 'description', 'type', 'author', 'created_time']
         read_only_fields = ['id', 'author', 'created_time']
 
 
-class ContributorSerializer(serializers.ModelSerializer):
+class ContributorSerializer(MinimalUpdateMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Contributor model.
     - Links users to projects
     - Only project author can manage contributors
     """
 
+    expandable_fields = {'user': UserCompactSerializer, 'project': ProjectSerializer}
+    serializer_related_field = ShardedPrimaryKeyRelatedField
+
     class Meta:
         model = Contributor
         fields = ['id', 'user', 'project', 'created_time']
         read_only_fields = ['id', 'created_time']
+        validators = [ShardedUniqueTogetherValidator(queryset=Contributor.objects.all(), fields=('user', 'project'))]
 
 
-class IssueSerializer(serializers.ModelSerializer):
+class IssueSerializer(MinimalUpdateMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Issue model.
     - Issues belong to projects
     - author and assignee are handled separately for security
+    - version is checked on update (optimistic locking, 409 on conflict)
     """
 
+    expandable_fields = {
+        'author': UserCompactSerializer,
+        'assignee': UserCompactSerializer,
+        'project': ProjectSerializer,
+    }
+    preview_fields = ('description',)
+    serializer_related_field = ShardedPrimaryKeyRelatedField
+
     class Meta:
         model = Issue
-        fields = ['id', 'name', 'description', 'priority', 'tag', 'status', 'project', 'author', 'assignee', 'created_time']
-        read_only_fields = ['id', 'author', 'created_time']
+        fields = ['id', 'name', 'description', 'priority', 'tag', 'status', 'project', 'author', 'assignee', 'created_time', 'version']
+        read_only_fields = ['id', 'author', 'created_time', 'version']
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(MinimalUpdateMixin, DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Comment model.
     - Comments are linked to issues
     - author is auto-set during creation
     """
 
+    expandable_fields = {'author': UserCompactSerializer, 'issue': IssueSerializer}
+    preview_fields = ('description',)
+    serializer_related_field = ShardedPrimaryKeyRelatedField
+
     class Meta:
         model = Comment
         fields = ['id', 'description', 'issue', 'author', 'created_time']
-        read_only_fields = ['id', 'author', 'created_time']
\ No newline at end of file
+        read_only_fields = ['id', 'author', 'created_time']
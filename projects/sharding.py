@@ -0,0 +1,280 @@
+"""
+Project sharding.
+
+Each project lives, with its contributors, issues, comments and daily
+rollups, on one database of ``PROJECT_SHARDS`` (aliases of ``DATABASES``,
+the first one being ``default``). Users and the global tables stay on
+``default``:
+
+- ``IdTicket`` hands out IDs unique across shards, so rows keep a single
+  ``/api/<resource>/<id>/`` URL wherever they live
+- ``ProjectDirectory`` records the shard of each project, chosen from the
+  project ID when it is created
+
+``ProjectShardRouter`` sends reads and writes of a row to its shard, lists
+spanning several shards are run on every shard in parallel and merged
+(``ShardedResults``). With a single shard (the default) nothing changes.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from contextvars import ContextVar
+from functools import partial
+from operator import attrgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+from django.db.models import Max
+
+from .models import Comment, Contributor, IdempotencyKey, IdTicket, Issue, Project, ProjectDirectory
+
+# Tickets are deleted every N allocations, the IDs already handed out are never reused
+TICKET_PRUNE_EVERY = 1000
+
+# Models whose IDs come from the tickets
+TICKETED_MODELS = (Project, Contributor, Issue, Comment)
+
+# Execute wrappers (connection.execute_wrapper()) also installed on the connections
+# of the pool threads while they run fan_out() tasks, e.g. by the profiling middleware
+execute_wrappers = ContextVar('shard_execute_wrappers', default=())
+
+_executor = None
+_executor_lock = threading.Lock()
+_tickets_seeded = False
+
+
+def get_shards():
+    return getattr(settings, 'PROJECT_SHARDS', [DEFAULT_DB_ALIAS])
+
+
+def is_sharded():
+    return len(get_shards()) > 1
+
+
+def is_sharded_model(model):
+    return model._meta.app_label == 'projects' and model not in (IdempotencyKey, IdTicket, ProjectDirectory)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'PROJECT_SHARD_WORKERS', None) or len(get_shards())
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='shard')
+    return _executor
+
+
+def _run_on(function, wrappers, alias):
+    # Pool threads keep their connections between tasks (up to CONN_MAX_AGE),
+    # as request threads do between requests
+    connection = connections[alias]
+    connection.close_if_unusable_or_obsolete()
+    with ExitStack() as stack:
+        for wrapper in wrappers:
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        return function(alias)
+
+
+def fan_out(function, aliases=None):
+    """
+    Call ``function(alias)`` for each shard in parallel, return the results in shard order.
+    Inside a transaction the shards are queried from the calling thread, so its
+    uncommitted writes are seen.
+    """
+    aliases = list(aliases or get_shards())
+    if len(aliases) == 1 or any(connections[alias].in_atomic_block for alias in aliases):
+        return [function(alias) for alias in aliases]
+    return list(get_executor().map(partial(_run_on, function, execute_wrappers.get()), aliases))
+
+
+def cache_key(model, pk):
+    return f"shard:{model._meta.label_lower}:{pk}"
+
+
+def seed_tickets(ticket_model, models, aliases):
+    """
+    Move the tickets above the highest ID of ``models`` on ``aliases``, so rows
+    created before sharding was enabled (plain auto-increment IDs) never collide
+    with ticket IDs. Takes historical models, for migrations.
+    """
+    highest = max((model._base_manager.using(alias).aggregate(highest=Max('pk'))['highest'] or 0
+                   for model in models for alias in aliases), default=0)
+    tickets = ticket_model._base_manager.using(DEFAULT_DB_ALIAS)
+    if not highest or tickets.filter(pk__gte=highest).exists():
+        return
+    try:
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            tickets.create(pk=highest)
+    except IntegrityError:
+        # Seeded concurrently
+        pass
+    # Explicit IDs do not move the sequences of some databases (e.g. PostgreSQL)
+    connection = connections[DEFAULT_DB_ALIAS]
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), [ticket_model]):
+            cursor.execute(sql)
+
+
+def allocate_id(instance):
+    """Return a new ID for ``instance``, unique across shards; projects get their directory entry."""
+    global _tickets_seeded
+    if not _tickets_seeded:
+        # Once per process: rows may have been added without tickets since the migration
+        seed_tickets(IdTicket, TICKETED_MODELS, get_shards())
+        _tickets_seeded = True
+    ticket = IdTicket.objects.create()
+    if ticket.pk % TICKET_PRUNE_EVERY == 0:
+        IdTicket.objects.filter(pk__lt=ticket.pk).delete()
+    if isinstance(instance, Project):
+        shards = get_shards()
+        entry = ProjectDirectory.objects.create(project_id=ticket.pk, shard=shards[ticket.pk % len(shards)])
+        cache.set(cache_key(Project, entry.project_id), entry.shard, None)
+    return ticket.pk
+
+
+def remember(instance):
+    """Cache the shard of a row just created, so it is never searched for."""
+    cache.set(cache_key(type(instance), instance.pk), instance._state.db, None)
+
+
+def shard_for_project(project_id):
+    """Shard of the project; projects created before sharding was enabled stay on the first shard."""
+    key = cache_key(Project, project_id)
+    alias = cache.get(key)
+    if alias is None:
+        alias = (ProjectDirectory.objects.filter(project_id=project_id).values_list('shard', flat=True).first()
+                 or get_shards()[0])
+        cache.set(key, alias, None)
+    return alias
+
+
+def locate(model, pk):
+    """
+    Shard holding the ``model`` row ``pk``. Projects are looked up in the directory,
+    other rows are searched on every shard in parallel; the answer is cached.
+    Unknown rows are reported on the first shard, where the lookup then finds nothing.
+    """
+    if not is_sharded() or not is_sharded_model(model):
+        return DEFAULT_DB_ALIAS
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        return get_shards()[0]
+    if model is Project:
+        return shard_for_project(pk)
+
+    key = cache_key(model, pk)
+    alias = cache.get(key)
+    if alias is None:
+        found = fan_out(lambda alias: model._base_manager.using(alias).filter(pk=pk).exists())
+        matches = [alias for alias, exists in zip(get_shards(), found) if exists]
+        if not matches:
+            return get_shards()[0]
+        alias = matches[0]
+        cache.set(key, alias, None)
+    return alias
+
+
+def shard_for_instance(instance):
+    """Shard of a row of a sharded model: its own for saved rows, its project's for new ones."""
+    if instance._state.db is not None and not instance._state.adding:
+        return instance._state.db
+    if isinstance(instance, Project):
+        return shard_for_project(instance.pk)
+    parent = instance._meta.get_field(getattr(instance, 'shard_parent', 'project'))
+    if parent.is_cached(instance) and parent.get_cached_value(instance) is not None:
+        return shard_for_instance(parent.get_cached_value(instance))
+    return locate(parent.related_model, getattr(instance, parent.attname))
+
+
+class ProjectShardRouter:
+    """
+    Database router of the project shards (``DATABASE_ROUTERS``).
+    Rows related to a loaded instance are read from the instance's shard,
+    users and the global tables from ``default``. Queries without an instance
+    go to ``default``: views route them with ``locate()`` or ``ShardedResults``.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not is_sharded():
+            return None
+        if not is_sharded_model(model):
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and is_sharded_model(type(instance)):
+            return shard_for_instance(instance)
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not (is_sharded_model(type(obj1)) and is_sharded_model(type(obj2))):
+            # Users live on default, referenced without a database constraint
+            return True
+        if obj1._state.adding or obj2._state.adding:
+            return True
+        return obj1._state.db == obj2._state.db
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == 'projects' and model_name in ('idempotencykey', 'idticket', 'projectdirectory'):
+            return db == DEFAULT_DB_ALIAS
+        return None
+
+
+class ShardedResults:
+    """
+    Read-only view of a queryset run on every shard in parallel.
+    Supports what the paginators use: ``count()``, slicing (each shard returns
+    its first ``stop`` rows, merged in the queryset ordering), ``filter()`` and ``order_by()``.
+    """
+
+    ordered = True
+
+    def __init__(self, queryset, aliases=None):
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        self.queryset = queryset
+        self.model = queryset.model
+        self.aliases = list(aliases or get_shards())
+
+    def _clone(self, queryset):
+        return type(self)(queryset, self.aliases)
+
+    def filter(self, *args, **kwargs):
+        return self._clone(self.queryset.filter(*args, **kwargs))
+
+    def order_by(self, *field_names):
+        return self._clone(self.queryset.order_by(*field_names))
+
+    def count(self):
+        return sum(fan_out(lambda alias: self.queryset.using(alias).count(), self.aliases))
+
+    def ordering(self):
+        query = self.queryset.query
+        return list(query.order_by or (self.model._meta.ordering if query.default_ordering else ()))
+
+    def merge(self, parts):
+        rows = [row for part in parts for row in part]
+        # Stable sorts, least significant field first
+        for field in reversed(self.ordering()):
+            name = field.lstrip('-')
+            get = attrgetter('pk' if name == 'pk' else name)
+            rows.sort(key=lambda row: (get(row) is None, get(row)), reverse=field.startswith('-'))
+        return rows
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        stop = index.stop
+        parts = fan_out(lambda alias: list(self.queryset.using(alias)[:stop]), self.aliases)
+        return self.merge(parts)[index]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __len__(self):
+        return len(self[:])
@@ -0,0 +1,133 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from projects import sharding
+from projects.models import Comment, Contributor, Issue, IssueDailyRollup, Project, ProjectDirectory
+
+
+def my_work_generation_key(user_id):
+    """Cache key of the generation counter of a user's "my work" cache entries."""
+    return f"my-work:generation:{user_id}"
+
+
+def get_my_work_generation(user_id):
+    return cache.get_or_set(my_work_generation_key(user_id), 0, timeout=None)
+
+
+def bump_my_work_generation(user_id):
+    """Invalidate every cached "my work" page of a user at once."""
+    key = my_work_generation_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # No counter yet, nothing cached to invalidate
+        pass
+
+
+@receiver(post_save, sender=Issue)
+@receiver(post_delete, sender=Issue)
+def invalidate_my_work(sender, instance, **kwargs):
+    """
+    Drop the cached "my work" pages of the author and (old and new) assignee.
+    Only a shortcut: the cache is per process and bulk ``update()`` sends no
+    signal, the pages are otherwise refreshed after ``MY_WORK_CACHE_TIMEOUT``.
+    """
+    users = {instance.author_id, instance.assignee_id, instance.loaded_value('assignee_id')}
+    for user_id in users - {None}:
+        bump_my_work_generation(user_id)
+
+
+@receiver(post_save, sender=Contributor)
+@receiver(post_delete, sender=Contributor)
+def invalidate_contributor_work(sender, instance, **kwargs):
+    """The issues a user sees change with their projects."""
+    bump_my_work_generation(instance.user_id)
+
+
+# Issue fields deciding the rollup buckets an issue counts in
+ROLLUP_FIELDS = ('project_id', 'created_time', 'finished_time', 'priority', 'tag')
+
+
+def rollup_buckets(values):
+    """
+    ``Counter`` of the (project, day, priority, tag, counter) buckets an issue with the
+    field ``values`` counts in, as the backfill_issue_rollups command counts them.
+    """
+    project_id, priority, tag = values['project_id'], values['priority'], values['tag']
+    buckets = Counter({(project_id, timezone.localdate(values['created_time']), priority, tag, 'opened'): 1})
+    if values['finished_time'] is not None:
+        buckets[project_id, timezone.localdate(values['finished_time']), priority, tag, 'finished'] += 1
+    return buckets
+
+
+def record_rollups(buckets, sign, using):
+    for (project_id, day, priority, tag, counter), count in buckets.items():
+        IssueDailyRollup.record(project_id, day, priority, tag, using=using, **{counter: sign * count})
+
+
+@receiver(pre_save, sender=Issue)
+def remember_rollup_buckets(sender, instance, raw=False, using=None, **kwargs):
+    """Keep the buckets the issue counts in before the save, read again when not all loaded."""
+    if raw or instance._state.adding:
+        instance._rollup_buckets = Counter()
+        return
+    values = {name: instance.loaded_value(name, DEFERRED) for name in ROLLUP_FIELDS}
+    if DEFERRED in values.values():
+        values = Issue.all_objects.using(using).filter(pk=instance.pk).values(*ROLLUP_FIELDS).first()
+    instance._rollup_buckets = rollup_buckets(values) if values else Counter()
+
+
+@receiver(post_save, sender=Issue)
+def update_daily_rollup(sender, instance, raw=False, using=None, **kwargs):
+    """
+    Move the issue between buckets: opened when created, finished when its status
+    becomes Finished (Issue.finished_time), uncounted when reopened, moved when its
+    priority or tag changes. Other edits of a finished issue leave its buckets alone.
+    """
+    if raw:
+        return
+    previous = getattr(instance, '_rollup_buckets', Counter())
+    current = rollup_buckets({name: getattr(instance, name) for name in ROLLUP_FIELDS})
+    record_rollups(current - previous, 1, using)
+    record_rollups(previous - current, -1, using)
+
+
+@receiver(post_delete, sender=Issue)
+def subtract_daily_rollup(sender, instance, using=None, **kwargs):
+    """Uncount a deleted issue."""
+    values = {name: instance.loaded_value(name, getattr(instance, name)) for name in ROLLUP_FIELDS}
+    record_rollups(rollup_buckets(values), -1, using)
+
+
+@receiver(post_delete, sender=Project)
+def remove_from_directory(sender, instance, **kwargs):
+    """Drop the directory entry of a deleted project (sharding enabled only)."""
+    if sharding.is_sharded():
+        ProjectDirectory.objects.filter(project_id=instance.pk).delete()
+        cache.delete(sharding.cache_key(Project, instance.pk))
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def delete_user_rows_on_shards(sender, instance, using, **kwargs):
+    """
+    Apply the on_delete of the user foreign keys on the other shards (sharding enabled only):
+    Django only cascades on the database of the user, the keys have no constraint.
+    """
+    if not sharding.is_sharded():
+        return
+    for alias in sharding.get_shards():
+        if alias == using:
+            continue
+        with transaction.atomic(using=alias):
+            Issue.all_objects.using(alias).filter(assignee=instance.pk).update(assignee=None)
+            Project.objects.using(alias).filter(author=instance.pk).delete()
+            Issue.all_objects.using(alias).filter(author=instance.pk).delete()
+            Comment.all_objects.using(alias).filter(author=instance.pk).delete()
+            Contributor.objects.using(alias).filter(user=instance.pk).delete()
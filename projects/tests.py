@@ -1,3 +1,701 @@
-from django.test import TestCase
+from contextlib import ExitStack
+from datetime import timedelta
+from io import StringIO
+from unittest import skipIf, skipUnless
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from projects import sharding, timeline
+from projects.models import (Comment, Contributor, IdempotencyKey, IdTicket, Issue, IssueDailyRollup, Project,
+                             StaleObjectError)
+from projects.views import exception_handler
+from softdesksupport import throttling
+from softdesksupport.profiling import profile_store
+from users.models import User
+
+
+def get_capturing_queries(client, url, params=None):
+    """GET ``url``, return the response and the SQL of the queries run on all databases."""
+    with ExitStack() as stack:
+        contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+        response = client.get(url, params)
+    return response, [query['sql'] for context in contexts for query in context.captured_queries]
+
+
+def get_counting_queries(client, url, params=None):
+    """GET ``url``, return the response and the number of queries run on all databases."""
+    response, queries = get_capturing_queries(client, url, params)
+    return response, len(queries)
+
+
+class AdminChangelistQueryCountTests(TestCase):
+    """The number of queries of each changelist must not grow with the number of rows."""
+
+    changelists = ['project', 'contributor', 'issue', 'comment']
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_rows(self, count):
+        """Create ``count`` projects with a contributor, an issue and a comment; return the issues."""
+        issues = []
+        for n in range(count):
+            user = User.objects.create_user(f'user{User.objects.count()}', password='x')
+            project = Project.objects.create(name=f'project {n}', description='d', type='iOS', author=user)
+            Contributor.objects.create(user=self.admin, project=project)
+            issue = Issue.objects.create(name=f'issue {n}', description='d', tag='BUG', project=project,
+                                         author=user, assignee=self.admin)
+            Comment.objects.create(description='c', issue=issue, author=user)
+            issues.append(issue)
+        return issues
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelists_query_count_is_constant(self):
+        self.create_rows(2)
+        searches = {'project': 'project', 'contributor': 'project', 'issue': 'issue', 'comment': 'issue'}
+        urls = {(name, q): reverse(f'admin:projects_{name}_changelist') + (f'?q={q}' if q else '')
+                for name in self.changelists for q in ('', searches[name])}
+        few = {key: self.count_queries(url) for key, url in urls.items()}
+
+        self.create_rows(8)
+        for (name, q), url in urls.items():
+            with self.subTest(changelist=name, q=q):
+                self.assertEqual(self.count_queries(url), few[name, q])
+
+    def test_search_is_a_prefix_search(self):
+        issues = self.create_rows(3)
+        url = reverse('admin:projects_issue_changelist')
+        response = self.client.get(url, {'q': '"issue 1"'})
+        # Changelists list the default shard
+        expected = [issue.pk for issue in issues[1:2] if issue._state.db == 'default']
+        self.assertEqual([issue.pk for issue in response.context['cl'].result_list], expected)
+        self.assertEqual(len(self.client.get(url, {'q': 'ssue'}).context['cl'].result_list), 0)
+
+    def test_changelist_search(self):
+        self.create_rows(3)
+        for name in self.changelists:
+            with self.subTest(changelist=name):
+                url = reverse(f'admin:projects_{name}_changelist')
+                self.assertEqual(self.client.get(url, {'q': 'issue 1'}).status_code, 200)
+                self.assertEqual(self.client.get(url, {'q': '1'}).status_code, 200)
+
+    def test_change_form_uses_autocomplete(self):
+        issue, = self.create_rows(1)
+        response = self.client.get(reverse('admin:projects_issue_change', args=[issue.pk]))
+        self.assertContains(response, 'admin-autocomplete')
+        # No <option> per user: only the selected values are rendered
+        self.assertNotContains(response, 'user0</option>')
+
+
+class RoleAnnotationTests(TestCase):
+    """Object permissions are evaluated from the roles annotated on the fetched row."""
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.author = User.objects.create_user('author', password='x')
+        cls.contributor = User.objects.create_user('contributor', password='x')
+        cls.outsider = User.objects.create_user('outsider', password='x')
+        cls.project = Project.objects.create(name='p', description='d', type='iOS', author=cls.author)
+        Contributor.objects.create(user=cls.contributor, project=cls.project)
+        cls.issue = Issue.objects.create(name='i', description='d', tag='BUG', project=cls.project, author=cls.author)
+        cls.comment = Comment.objects.create(description='c', issue=cls.issue, author=cls.author)
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        self.client = APIClient()
+
+    def test_detail_is_one_query(self):
+        self.client.force_authenticate(self.contributor)
+        for url in (f'/api/projects/{self.project.pk}/', f'/api/issues/{self.issue.pk}/',
+                    f'/api/comments/{self.comment.pk}/'):
+            # On the shard of the project when sharding is enabled
+            with self.subTest(url=url), self.assertNumQueries(1, using=self.project._state.db):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_contributor_cannot_update(self):
+        self.client.force_authenticate(self.contributor)
+        response = self.client.patch(f'/api/issues/{self.issue.pk}/', {'status': 'Finished'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_lists_are_scoped_to_members(self):
+        for user, expected in ((self.contributor, 1), (self.outsider, 0)):
+            self.client.force_authenticate(user)
+            for url in ('/api/projects/', '/api/contributors/', '/api/issues/', '/api/comments/'):
+                with self.subTest(user=user.username, url=url):
+                    response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertEqual(response.json()['count'], expected)
+
+
+class SparseFieldsTests(TestCase):
+    """``?fields=`` trims the SELECT, ``?expand=`` joins the relations instead of querying per row."""
+
+    databases = '__all__'
+    # url -> (table, column trimmed by ?fields=id, expansions); contributors only have cheap columns
+    resources = {
+        '/api/projects/': ('projects_project', 'type', 'author'),
+        '/api/contributors/': ('projects_contributor', None, 'user,project'),
+        '/api/issues/': ('projects_issue', 'priority', 'author,assignee,project'),
+        '/api/comments/': ('projects_comment', 'description', 'author,issue'),
+    }
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        cache.clear()
+        self.client = APIClient()
+        self.author = User.objects.create_user('author', password='x')
+        self.client.force_authenticate(self.author)
+        # Rows on every shard: each shard with rows runs its queries
+        self.create_rows(2 * len(sharding.get_shards()))
+
+    def create_rows(self, count):
+        for n in range(count):
+            project = Project.objects.create(name=f'p{n}', description='d', type='iOS', author=self.author)
+            Contributor.objects.create(user=self.author, project=project)
+            issue = Issue.objects.create(name=f'i{n}', description='d', tag='BUG', project=project,
+                                         author=self.author, assignee=self.author)
+            Comment.objects.create(description='c', issue=issue, author=self.author)
+
+    def test_fields_trim_the_select(self):
+        for url, (table, column, _) in self.resources.items():
+            with self.subTest(url=url):
+                response, queries = get_capturing_queries(self.client, url, {'fields': 'id'})
+                self.assertEqual(list(response.json()['results'][0]), ['id'])
+                selects = [sql for sql in queries if sql.startswith('SELECT') and f'FROM "{table}"' in sql]
+                self.assertTrue(selects)
+                for sql in selects if column else ():
+                    self.assertNotIn(f'"{table}"."{column}"', sql.split(' FROM ')[0])
+
+    def test_expand_adds_no_query_per_row(self):
+        counts = {}
+        for url, (_, _, expand) in self.resources.items():
+            plain = get_counting_queries(self.client, url)[1]
+            response, counts[url] = get_counting_queries(self.client, url, {'expand': expand})
+            for name in expand.split(','):
+                self.assertIsInstance(response.json()['results'][0][name], dict)
+            if not sharding.is_sharded():
+                # Joined; with shards, users are read by one more query (prefetch)
+                self.assertEqual(counts[url], plain, url)
+        self.create_rows(4)
+        for url, (_, _, expand) in self.resources.items():
+            with self.subTest(url=url):
+                response, count = get_counting_queries(self.client, url, {'expand': expand})
+                self.assertEqual(len(response.json()['results']), 2 * len(sharding.get_shards()) + 4)
+                self.assertEqual(count, counts[url])
+
+
+
+class PreviewTests(TestCase):
+    """Lists send a preview of the large text fields, expanded objects included."""
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.author = User.objects.create_user('author', password='x')
+        cls.project = Project.objects.create(name='p', description='p' * 500, type='iOS', author=cls.author)
+        cls.issue = Issue.objects.create(name='i', description='i' * 500, tag='BUG', project=cls.project,
+                                         author=cls.author)
+        Comment.objects.create(description='c' * 500, issue=cls.issue, author=cls.author)
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_expanded_objects_are_previewed(self):
+        for url, name in (('/api/issues/', 'project'), ('/api/comments/', 'issue')):
+            with self.subTest(url=url):
+                row, = self.client.get(url, {'expand': name}).json()['results']
+                self.assertNotIn('description', row[name])
+                self.assertEqual(row[name]['description_length'], 500)
+                self.assertLess(len(row[name]['description_preview']), 500)
+
+    def test_requested_description_is_previewed(self):
+        row, = self.client.get('/api/issues/', {'fields': 'id,description'}).json()['results']
+        self.assertEqual(set(row), {'id', 'description_preview', 'description_length'})
+        row = self.client.get(f'/api/issues/{self.issue.pk}/', {'fields': 'id,description'}).json()
+        self.assertEqual(row, {'id': self.issue.pk, 'description': 'i' * 500})
+
+    def test_trimmed_lists_do_not_load_the_text(self):
+        urls = {'/api/projects/': 'id,name,author', '/api/issues/': 'id,name,author', '/api/comments/': 'id,author'}
+        few = {url: get_counting_queries(self.client, url, {'fields': fields, 'expand': 'author'})[1]
+               for url, fields in urls.items()}
+        for n in range(4):
+            project = Project.objects.create(name=f'p{n}', description='p', type='iOS', author=self.author)
+            issue = Issue.objects.create(name=f'i{n}', description='i', tag='BUG', project=project, author=self.author)
+            Comment.objects.create(description='c', issue=issue, author=self.author)
+        for url, fields in urls.items():
+            with self.subTest(url=url):
+                response, count = get_counting_queries(self.client, url, {'fields': fields, 'expand': 'author'})
+                self.assertEqual(len(response.json()['results']), 5)
+                self.assertEqual(count, few[url])
+
+
+class TimelineTests(TestCase):
+    """The timeline cursor walks every event once, ties on created_time included."""
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.author = User.objects.create_user('author', password='x')
+        cls.project = Project.objects.create(name='p', description='d', type='iOS', author=cls.author)
+        Contributor.objects.create(user=cls.author, project=cls.project)
+        for n in range(3):
+            issue = Issue.objects.create(name=f'i{n}', description='d', tag='BUG', project=cls.project,
+                                         author=cls.author)
+            Comment.objects.create(description='c', issue=issue, author=cls.author)
+        # Every event of every source at the same instant
+        now = timezone.now()
+        for model in (Issue, Comment, Contributor):
+            model._base_manager.using(cls.project._state.db).update(created_time=now)
+
+    def test_cursor_walks_ties_between_sources(self):
+        for page_size in (1, 2, 4):
+            with self.subTest(page_size=page_size):
+                seen, cursor = [], None
+                while True:
+                    events, cursor = timeline.get_page(self.project, page_size, cursor)
+                    seen += [(event['type'], event['id']) for event in events]
+                    if cursor is None:
+                        break
+                self.assertEqual(len(seen), 7)
+                self.assertEqual(len(set(seen)), 7)
+
+    def test_archived_rows_stay_in_the_timeline(self):
+        db = self.project._state.db
+        now = timezone.now()
+        Issue.objects.using(db).update(archived_time=now)
+        Comment.objects.using(db).update(archived_time=now)
+        events, _ = timeline.get_page(self.project, 10)
+        self.assertEqual(len(events), 7)
+
+    @skipIf(sharding.is_sharded(), "issues are not moved across shards")
+    def test_comments_follow_their_issue(self):
+        other = Project.objects.create(name='o', description='d', type='iOS', author=self.author)
+        comment = Comment.objects.first()
+        self.assertEqual(comment.project_id, self.project.pk)
+        issue = comment.issue
+        issue.project = other
+        issue.save()
+        comment.refresh_from_db()
+        self.assertEqual(comment.project_id, other.pk)
+
+
+
+class ArchivalTests(TestCase):
+    """Finished issues untouched for long are archived, in batches, and hidden by default."""
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.author = User.objects.create_user('author', password='x')
+        cls.project = Project.objects.create(name='p', description='d', type='iOS', author=cls.author)
+        cls.issues = [Issue.objects.create(name=f'i{n}', description='d', tag='BUG', project=cls.project,
+                                           author=cls.author, status=status)
+                      for n, status in enumerate(('Finished', 'Finished', 'Finished', 'In Progress'))]
+        for issue in cls.issues:
+            Comment.objects.create(description='c', issue=issue, author=cls.author)
+        # All but the third untouched for a year
+        old = [issue.pk for issue in cls.issues if issue.name != 'i2']
+        Issue.objects.using(cls.project._state.db).filter(pk__in=old).update(
+            updated_time=timezone.now() - timedelta(days=365))
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def archive(self):
+        output = StringIO()
+        call_command('archive_issues', days=90, batch_size=1, stdout=output)
+        return output.getvalue()
+
+    def test_archive_command(self):
+        self.assertIn('Archived 2 issue(s) and 2 comment(s)', self.archive())
+        db = self.project._state.db
+        self.assertEqual(sorted(Issue.objects.using(db).values_list('name', flat=True)), ['i2', 'i3'])
+        self.assertEqual(Issue.all_objects.using(db).count(), 4)
+        self.assertEqual(Comment.objects.using(db).count(), 2)
+        self.assertIn('Archived 0 issue(s)', self.archive())
+
+    @skipUnless(connection.vendor == 'sqlite', "query plans of SQLite")
+    def test_default_managers_use_the_partial_indexes(self):
+        db = self.project._state.db
+        plans = {
+            'issue_active_project_idx': Issue.objects.using(db).filter(project=self.project).order_by('-created_time'),
+            'issue_active_assignee_idx': Issue.objects.using(db).filter(assignee=self.author, status='To Do'),
+            'comment_active_issue_idx': Comment.objects.using(db).filter(issue=self.issues[0]),
+            'comment_active_project_idx': Comment.objects.using(db).filter(project=self.project),
+        }
+        for index, queryset in plans.items():
+            with self.subTest(index=index):
+                self.assertIn(index, queryset.explain())
+
+    def test_archived_query_parameter(self):
+        self.archive()
+        for url, expected in (('/api/issues/', 2), ('/api/comments/', 2)):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).json()['count'], expected)
+                archived = self.client.get(url, {'archived': 'true'}).json()
+                self.assertEqual(archived['count'], 2)
+        names = {row['name'] for row in self.client.get('/api/issues/', {'archived': 'true'}).json()['results']}
+        self.assertEqual(names, {'i0', 'i1'})
+
+
+
+class MyWorkTests(TestCase):
+    """The user's open issues across projects, cursor paginated and cached for a while."""
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='x')
+        cls.assignee = User.objects.create_user('assignee', password='x')
+        cls.project = Project.objects.create(name='p', description='d', type='iOS', author=cls.author)
+        Contributor.objects.create(user=cls.assignee, project=cls.project)
+        for n in range(12):
+            Issue.objects.create(name=f'i{n}', description='d', tag='BUG', project=cls.project,
+                                 author=cls.author, assignee=cls.assignee)
+        Issue.objects.create(name='done', description='d', tag='BUG', project=cls.project, author=cls.author,
+                             assignee=cls.assignee, status='Finished')
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.assignee)
+
+    def walk(self, params):
+        names, url = [], '/api/my-work/'
+        while url:
+            page = self.client.get(url, params).json()
+            names += [row['name'] for row in page['results']]
+            url, params = page['next'], None
+        return names
+
+    def test_cursor_pages(self):
+        names = self.walk({})
+        self.assertEqual(names, [f'i{n}' for n in reversed(range(12))])
+        self.assertEqual(self.walk({'status': 'Finished'}), ['done'])
+        self.assertEqual(self.walk({'role': 'authored'}), [])
+
+    def test_cached_until_an_issue_is_saved(self):
+        self.client.get('/api/my-work/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/my-work/')
+        issue = Issue.objects.using(self.project._state.db).get(name='i11')
+        issue.status = 'Finished'
+        issue.save()
+        self.assertEqual(self.client.get('/api/my-work/').json()['results'][0]['name'], 'i10')
+
+
+
+class DailyRollupTests(TestCase):
+    """The rollups maintained on save and delete equal the ones rebuilt by the backfill."""
+
+    databases = '__all__'
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        cache.clear()
+        self.author = User.objects.create_user('author', password='x')
+        self.project = Project.objects.create(name='p', description='d', type='iOS', author=self.author)
+
+    def snapshot(self):
+        rollups = IssueDailyRollup.objects.using(self.project._state.db).exclude(opened=0, finished=0)
+        return sorted(rollups.values_list('day', 'priority', 'tag', 'opened', 'finished'))
+
+    def assertMatchesBackfill(self):
+        recorded = self.snapshot()
+        call_command('backfill_issue_rollups', stdout=StringIO())
+        self.assertEqual(recorded, self.snapshot())
+
+    def create_issue(self, **fields):
+        return Issue.objects.create(**{'name': 'i', 'description': 'd', 'tag': 'BUG', 'project': self.project,
+                                       'author': self.author, **fields})
+
+    def test_reopened_issue_is_finished_once(self):
+        issue = self.create_issue()
+        for status in ('Finished', 'In Progress', 'Finished'):
+            issue.status = status
+            issue.save()
+        self.assertEqual([row[3:] for row in self.snapshot()], [(1, 1)])
+        self.assertMatchesBackfill()
+
+    def test_later_edits_keep_the_finished_day(self):
+        issue = self.create_issue(status='Finished')
+        db = self.project._state.db
+        three_days_ago = timezone.now() - timedelta(days=3)
+        Issue.objects.using(db).filter(pk=issue.pk).update(finished_time=three_days_ago)
+        call_command('backfill_issue_rollups', stdout=StringIO())
+        before = self.snapshot()
+        issue = Issue.objects.using(db).get(pk=issue.pk)
+        issue.name = 'renamed'
+        issue.save()
+        self.assertEqual(self.snapshot(), before)
+        self.assertIn((timezone.localdate(three_days_ago), 0, 1), [(row[0], *row[3:]) for row in before])
+        issue.status = 'In Progress'
+        issue.save()
+        self.assertIsNone(Issue.objects.using(db).get(pk=issue.pk).finished_time)
+        self.assertMatchesBackfill()
+
+    def test_priority_and_tag_changes_move_the_issue(self):
+        issue = self.create_issue(status='Finished')
+        issue.priority, issue.tag = 'HIGH', 'FEATURE'
+        issue.save()
+        self.assertEqual([row[1:] for row in self.snapshot()], [('HIGH', 'FEATURE', 1, 1)])
+        self.assertMatchesBackfill()
+
+    def test_deleted_issue_is_subtracted(self):
+        self.create_issue(status='Finished')
+        kept = self.create_issue()
+        Issue.objects.using(self.project._state.db).exclude(pk=kept.pk).get().delete()
+        self.assertEqual([row[3:] for row in self.snapshot()], [(1, 0)])
+        self.assertMatchesBackfill()
+
+    def test_partially_loaded_issue(self):
+        self.create_issue()
+        issue = Issue.objects.using(self.project._state.db).only('pk', 'priority').get()
+        issue.priority = 'HIGH'
+        issue.save(update_fields=['priority'])
+        self.assertEqual([row[1:] for row in self.snapshot()], [('HIGH', 'BUG', 1, 0)])
+        self.assertMatchesBackfill()
+
+
+
+class OptimisticLockingTests(TestCase):
+    """Updates of an issue edited in an older version are refused with 409 Conflict."""
+
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.author = User.objects.create_superuser('author', 'author@example.com', 'x')
+        cls.project = Project.objects.create(name='p', description='d', type='iOS', author=cls.author)
+        cls.issue = Issue.objects.create(name='i', description='d', tag='BUG', project=cls.project, author=cls.author)
+        # Saved by someone else: version 1
+        cls.issue.save()
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.url = f'/api/issues/{self.issue.pk}/'
+
+    def stored(self):
+        return Issue.objects.using(self.project._state.db).get(pk=self.issue.pk)
+
+    def test_stale_version_in_body(self):
+        response = self.client.patch(self.url, {'name': 'new', 'version': 0}, format='json')
+        self.assertEqual(response.status_code, 409)
+        response = self.client.patch(self.url, {'name': 'new', 'version': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], 2)
+
+    def test_stale_version_in_if_match(self):
+        response = self.client.patch(self.url, {'name': 'new'}, format='json', HTTP_IF_MATCH='"0"')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.stored().name, 'i')
+
+    def test_unchanged_patch_writes_nothing(self):
+        shard = connections[self.project._state.db]
+        with CaptureQueriesContext(shard) as context:
+            response = self.client.patch(self.url, {'name': 'i', 'version': 1}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual(self.stored().version, 1)
+
+    def test_stale_save_outside_serializers(self):
+        response = exception_handler(StaleObjectError(), {})
+        self.assertEqual(response.status_code, 409)
+
+    @skipIf(sharding.is_sharded(), "the admin form validates the project on the default database")
+    def test_stale_admin_form(self):
+        self.client.force_login(self.author)
+        url = reverse('admin:projects_issue_change', args=[self.issue.pk])
+        form = {'name': 'new', 'description': 'd', 'priority': 'LOW', 'tag': 'BUG', 'status': 'To Do',
+                'project': self.project.pk, 'author': self.author.pk, 'assignee': '', 'loaded_version': 0}
+        response = self.client.post(url, form, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'modified by someone else')
+        self.assertEqual(self.stored().name, 'i')
+        response = self.client.post(url, dict(form, loaded_version=1))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.stored().name, 'new')
+
+
+
+class IdempotencyKeyTests(TestCase):
+    """Retries of a POST with the same Idempotency-Key replay the first response."""
+
+    body = {'name': 'p', 'description': 'd', 'type': 'iOS'}
+    databases = '__all__'
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        self.client = APIClient()
+        self.user = User.objects.create_user('author', password='x')
+        self.client.force_authenticate(self.user)
+
+    def count_projects(self):
+        return sharding.ShardedResults(Project.objects.all()).count()
+
+    def post(self, body, key='retry-1'):
+        return self.client.post('/api/projects/', body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post(self.body)
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):  # the key lookup, no model table
+            retry = self.post(self.body)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.count_projects(), 1)
+
+    def test_key_reused_with_another_body(self):
+        self.post(self.body)
+        self.assertEqual(self.post(dict(self.body, name='other')).status_code, 422)
+        self.assertEqual(self.count_projects(), 1)
+
+    def test_key_of_a_running_request(self):
+        IdempotencyKey.objects.create(user=self.user, key='retry-1', fingerprint='running')
+        self.assertEqual(self.post(self.body).status_code, 409)
+        self.assertEqual(self.count_projects(), 0)
+
+    def test_failed_request_releases_the_key(self):
+        self.assertEqual(self.post({}).status_code, 400)
+        self.assertEqual(self.post(self.body).status_code, 201)
+
+
+@skipUnless(sharding.is_sharded(), "run with SOFTDESK_PROJECT_SHARDS=3 to test several shards")
+class ShardingTests(TransactionTestCase):
+    """Projects are spread over the shards, the API reads and merges them transparently."""
+
+    databases = '__all__'
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        cache.clear()
+        self.client = APIClient()
+        self.author = User.objects.create_user('author', password='x')
+        self.member = User.objects.create_user('member', password='x')
+        self.client.force_authenticate(self.author)
+
+    def create(self, url, data):
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def test_project_tree_lives_on_its_shard(self):
+        project_ids = [self.create('/api/projects/', {'name': f'p{n}', 'description': 'd', 'type': 'iOS'})
+                       for n in range(len(sharding.get_shards()))]
+        shards = {sharding.shard_for_project(pk) for pk in project_ids}
+        self.assertEqual(shards, set(sharding.get_shards()))
+
+        project_id = project_ids[1]
+        shard = sharding.shard_for_project(project_id)
+        issue_id = self.create('/api/issues/', {'name': 'i', 'description': 'd', 'tag': 'BUG', 'project': project_id})
+        comment_id = self.create('/api/comments/', {'description': 'c', 'issue': issue_id})
+        self.client.force_authenticate(User.objects.create_user('staff', password='x', is_staff=True))
+        contributor_id = self.create('/api/contributors/', {'user': self.member.pk, 'project': project_id})
+        self.assertEqual(self.client.post('/api/contributors/', {'user': self.member.pk, 'project': project_id},
+                                          format='json').status_code, 400)
+        for model, pk in ((Project, project_id), (Issue, issue_id), (Comment, comment_id), (Contributor, contributor_id)):
+            self.assertTrue(model._base_manager.using(shard).filter(pk=pk).exists())
+
+        self.client.force_authenticate(self.member)
+
+        response = self.client.get(f'/api/comments/{comment_id}/', {'expand': 'author'})
+        self.assertEqual(response.json()['author']['username'], 'author')
+        response = self.client.get(f'/api/projects/{project_id}/timeline/')
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_deleting_a_user_cleans_every_shard(self):
+        project_ids = [self.create('/api/projects/', {'name': f'p{n}', 'description': 'd', 'type': 'iOS'})
+                       for n in range(len(sharding.get_shards()))]
+        self.client.force_authenticate(self.member)
+        other = self.create('/api/projects/', {'name': 'other', 'description': 'd', 'type': 'iOS'})
+        assigned = self.create('/api/issues/', {'name': 'i', 'description': 'd', 'tag': 'BUG', 'project': other,
+                                                'assignee': self.author.pk})
+        self.author.delete()
+        for alias in sharding.get_shards():
+            self.assertFalse(Project.objects.using(alias).filter(pk__in=project_ids).exists())
+        shard = sharding.shard_for_project(other)
+        self.assertIsNone(Issue.objects.using(shard).get(pk=assigned).assignee_id)
+
+    def test_tickets_start_above_rows_created_before_sharding(self):
+        # A project created before sharding: plain ID, on the first shard
+        legacy = Project.objects.create(pk=500, name='legacy', description='d', type='iOS', author=self.author)
+        self.assertEqual(legacy._state.db, sharding.get_shards()[0])
+        sharding.seed_tickets(IdTicket, sharding.TICKETED_MODELS, sharding.get_shards())
+        self.assertGreater(self.create('/api/projects/', {'name': 'new', 'description': 'd', 'type': 'iOS'}), 500)
+
+    def test_lists_merge_all_shards(self):
+        project_ids = [self.create('/api/projects/', {'name': f'p{n}', 'description': 'd', 'type': 'iOS'})
+                       for n in range(12)]
+        response = self.client.get('/api/projects/')
+        self.assertEqual(response.json()['count'], 12)
+        pages = response.json()['results'] + self.client.get('/api/projects/', {'page': 2}).json()['results']
+        self.assertEqual([project['id'] for project in pages], sorted(project_ids))
+
+        for pk in project_ids[:3]:
+            self.create('/api/issues/', {'name': 'i', 'description': 'd', 'tag': 'BUG', 'project': pk,
+                                         'assignee': self.author.pk})
+        response = self.client.get('/api/my-work/')
+        self.assertEqual(len(response.json()['results']), 3)
+
+        self.client.force_authenticate(self.member)
+        self.assertEqual(self.client.get('/api/projects/').json()['count'], 0)
+
+    def test_rows_are_not_moved_across_shards(self):
+        project_ids = [self.create('/api/projects/', {'name': f'p{n}', 'description': 'd', 'type': 'iOS'})
+                       for n in range(len(sharding.get_shards()))]
+        issue_ids = [self.create('/api/issues/', {'name': 'i', 'description': 'd', 'tag': 'BUG', 'project': pk})
+                     for pk in project_ids[:2]]
+        comment_id = self.create('/api/comments/', {'description': 'c', 'issue': issue_ids[0]})
+        response = self.client.patch(f'/api/issues/{issue_ids[0]}/', {'project': project_ids[1]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('project', response.json())
+        response = self.client.patch(f'/api/comments/{comment_id}/', {'issue': issue_ids[1]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('issue', response.json())
+
+    def test_profiles_include_the_queries_of_every_shard(self):
+        for n in range(len(sharding.get_shards())):
+            self.create('/api/projects/', {'name': f'p{n}', 'description': 'd', 'type': 'iOS'})
+        staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_authenticate(staff)
+        self.client.force_login(staff)
+        response = self.client.get('/api/projects/', HTTP_X_PROFILE='1')
+        profile = profile_store.get(int(response['X-Profile-Id']))
+        self.assertEqual({query['database'] for query in profile['queries']}, set(sharding.get_shards()))
@@ -0,0 +1,84 @@
+"""
+Activity timeline of a project: creation of issues, comments and contributors,
+newest first.
+
+Each source is read with its own query, already ordered and limited to one
+page, then the sorted streams are merged with a k-way merge (heapq.merge).
+Pages are cut with a keyset cursor on (created_time, source rank, id), so a
+deep page costs the same as the first one.
+"""
+
+import base64
+import heapq
+from datetime import datetime
+
+from django.db.models import F, Q, Value
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import DateTimeField
+
+from .models import Comment, Contributor, Issue
+
+# type -> (rank breaking created_time ties, queryset builder, columns, aliased columns).
+# Archived issues and comments stay in the history of their project (all_objects)
+SOURCES = {
+    'issue': (0, lambda project: Issue.all_objects.filter(project=project),
+              ('name',), {'actor': F('author_id'), 'issue_id': F('id')}),
+    'comment': (1, lambda project: Comment.all_objects.filter(project=project),
+                ('issue_id',), {'actor': F('author_id')}),
+    'contributor': (2, lambda project: Contributor.objects.filter(project=project),
+                    (), {'actor': F('user_id')}),
+}
+
+
+def encode_cursor(event):
+    raw = f"{event['created_time'].isoformat()}|{SOURCES[event['type']][0]}|{event['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (created_time, rank, id) key encoded in ``cursor``."""
+    try:
+        created_time, rank, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(created_time), int(rank), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def after_cursor(rank, cursor):
+    """Filter keeping the rows of a source (of ``rank``) strictly after ``cursor``, newest first."""
+    created_time, cursor_rank, pk = cursor
+    if rank < cursor_rank:
+        return Q(created_time__lte=created_time)
+    if rank > cursor_rank:
+        return Q(created_time__lt=created_time)
+    return Q(created_time__lt=created_time) | Q(created_time=created_time, id__lt=pk)
+
+
+def sort_key(event):
+    return event['created_time'], SOURCES[event['type']][0], event['id']
+
+
+def get_page(project, page_size, cursor=None):
+    """
+    Return ``(events, next_cursor)``: at most ``page_size`` events of ``project``
+    after ``cursor`` (newest first), and the cursor of the next page or None.
+    """
+    key = decode_cursor(cursor) if cursor else None
+    streams = []
+    for event_type, (rank, build_queryset, columns, aliases) in SOURCES.items():
+        queryset = build_queryset(project).using(project._state.db)
+        if key is not None:
+            queryset = queryset.filter(after_cursor(rank, key))
+        streams.append(
+            queryset.order_by('-created_time', '-id')
+            .values('id', 'created_time', *columns, type=Value(event_type), **aliases)[:page_size + 1]
+        )
+
+    events = list(heapq.merge(*streams, key=sort_key, reverse=True))[:page_size + 1]
+    next_cursor = encode_cursor(events[page_size - 1]) if len(events) > page_size else None
+
+    date_field = DateTimeField()
+    page = events[:page_size]
+    for event in page:
+        event['created_time'] = date_field.to_representation(event['created_time'])
+    return page, next_cursor
@@ -1,16 +1,167 @@
-from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated
-from .models import Project, Contributor, Issue, Comment
+import hashlib
+import json
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from rest_framework import mixins, status, views, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .models import Project, Contributor, Issue, Comment, IdempotencyKey, IssueDailyRollup, StaleObjectError
 from .serializers import ProjectSerializer, ContributorSerializer, IssueSerializer, CommentSerializer
 from .permissions import CommentPermission, ContributorPermission, IssuePermission, ProjectPermission
+from .serializers import Conflict, is_preview_request, parse_list_param
+from .signals import get_my_work_generation
+from . import sharding, timeline
 from users.models import User
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+def exception_handler(exc, context):
+    """
+    DRF exception handler (``EXCEPTION_HANDLER``): a concurrent update
+    (StaleObjectError) is answered with 409 Conflict, whichever code saved.
+    """
+    if isinstance(exc, StaleObjectError):
+        exc = Conflict()
+    return views.exception_handler(exc, context)
+
+
+def wants_archived(request):
+    """Return True when a read request asks for archived rows (``?archived=true``)."""
+    if request.method not in SAFE_METHODS:
+        return False
+    return request.query_params.get('archived', '').lower() in ('1', 'true', 'yes')
+
+
+class DynamicFieldsViewMixin:
+    """
+    Apply ``?fields=`` and ``?expand=`` to the queryset of read requests,
+    so the SELECT is trimmed and expanded relations are joined in the same query.
+    Lists skip the large text columns and get their preview from the database.
+    The serializer class must use ``DynamicFieldsMixin``.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+        return self.get_serializer_class().optimize_queryset(
+            queryset, self.request, preview=is_preview_request(self)
+        )
+
+
+class ShardedViewMixin:
+    """
+    Route the queryset to the project shards (projects.sharding), when sharding is enabled:
+    detail requests read the shard holding the object, lists run on every shard
+    in parallel and are merged. Comes before DynamicFieldsViewMixin.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if not sharding.is_sharded():
+            return queryset
+        lookup = self.kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        if lookup is not None:
+            return queryset.using(sharding.locate(queryset.model, lookup))
+        return sharding.ShardedResults(queryset)
+
+
+class IdempotencyKeyMismatch(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used with a different request.'
+    default_code = 'idempotency_key_mismatch'
+
+
+class IdempotentCreateMixin:
+    """
+    Honour the ``Idempotency-Key`` header on POST: the first successful response
+    is stored per user and key (IdempotencyKey) for ``IDEMPOTENCY_KEY_TTL`` seconds,
+    and a retry with the same key and body replays it without validating or inserting again.
+    - Same key while the first request is running: 409 Conflict
+    - Same key with a different body or endpoint: 422 Unprocessable Entity
+    """
+
+    idempotency_header = 'Idempotency-Key'
+    idempotency_key_max_length = 255
+    # Seconds a key stays locked by a request that never completes (e.g. killed worker)
+    idempotency_lock_timeout = 60
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(self.idempotency_header)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > self.idempotency_key_max_length:
+            raise ValidationError({self.idempotency_header: f'At most {self.idempotency_key_max_length} characters.'})
+
+        fingerprint = hashlib.md5(
+            (request.path + json.dumps(request.data, sort_keys=True, default=str)).encode()
+        ).hexdigest()
+        record = self.claim_idempotency_key(request.user, key, fingerprint)
+        if record.status_code is not None:
+            headers = {'Location': record.location} if record.location else None
+            response = Response(record.response, status=record.status_code, headers=headers)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = super().create(request, *args, **kwargs)
+        except Exception:
+            # Failed requests are not recorded, the client may retry with the same key
+            record.delete()
+            raise
+        record.status_code = response.status_code
+        record.response = response.data
+        record.location = response.get('Location', '')
+        record.save(update_fields=['status_code', 'response', 'location'])
+        return response
+
+    def claim_idempotency_key(self, user, key, fingerprint):
+        """
+        Return the record of ``key``: a new one without status code (the caller runs
+        the request), or the completed one to replay. Expired and abandoned records are replaced.
+        """
+        now = timezone.now()
+        for attempt in range(2):
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if record is None:
+                try:
+                    # The unique (user, key) constraint lets a single request claim the key
+                    with transaction.atomic():
+                        return IdempotencyKey.objects.create(user=user, key=key, fingerprint=fingerprint)
+                except IntegrityError:
+                    continue
+            expired = record.created_time < now - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+            abandoned = (record.status_code is None
+                         and record.created_time < now - timedelta(seconds=self.idempotency_lock_timeout))
+            if expired or abandoned:
+                record.delete()
+                continue
+            if record.status_code is None:
+                break
+            if record.fingerprint != fingerprint:
+                raise IdempotencyKeyMismatch()
+            return record
+        raise Conflict('A request with this Idempotency-Key is still being processed, retry later.')
+
+
+class ProjectViewSet(IdempotentCreateMixin, ShardedViewMixin, DynamicFieldsViewMixin, viewsets.ModelViewSet):
     """
     CRUD API for Projects.
     - Authors can create, read, update, delete their own projects
     - Other authenticated users can only read projects
+    - ``/projects/{id}/timeline/`` lists the project activity
+    - ``/projects/{id}/analytics/`` returns issues opened/finished per day
+    - POST accepts an ``Idempotency-Key`` header, retries replay the first response
+    - ``?fields=`` trims the payload, ``?expand=`` inlines related objects
     """
 
     queryset = Project.objects.all()
@@ -24,19 +175,61 @@ class ProjectViewSet(viewsets.ModelViewSet):
         user = self.request.user
         
         if user.is_staff:
-            return Project.objects.all()
+            return Project.objects.with_roles(user)
         
-        authored = Project.objects.filter(author=user)
-        contributed = Project.objects.filter(contributors__user=user)
-        user_projects = (authored | contributed).distinct()
+        # Projects authored or contributed to, roles annotated for the permission checks
+        return Project.objects.visible_to(user)
+
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """
+        Activity of the project, newest first: issues, comments and contributors added.
+        Keyset paginated, follow ``next`` (``?cursor=``) for older events.
+        """
+        project = self.get_object()
+        events, next_cursor = timeline.get_page(
+            project, settings.REST_FRAMEWORK['PAGE_SIZE'], request.query_params.get('cursor')
+        )
+        next_url = None
+        if next_cursor is not None:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+        return Response({'next': next_url, 'results': events})
+
+    @action(detail=True, methods=['get'])
+    def analytics(self, request, pk=None):
+        """
+        Issues opened and finished per day, summed from the daily rollups.
+        - ``?start=`` / ``?end=`` (YYYY-MM-DD, inclusive), the last 30 days by default
+        - ``?group_by=priority`` or ``?group_by=tag`` splits each day
+        """
+        project = self.get_object()
+        end = self.parse_date('end', timezone.localdate())
+        start = self.parse_date('start', end - timedelta(days=29))
+        group_by = request.query_params.get('group_by')
+        if group_by not in (None, 'priority', 'tag'):
+            raise ValidationError({'group_by': "Expected 'priority' or 'tag'."})
 
-        return user_projects
+        buckets = IssueDailyRollup.objects.using(project._state.db).filter(project=project, day__range=(start, end))
+        columns = ['day', group_by] if group_by else ['day']
+        days = buckets.values(*columns).annotate(opened=Sum('opened'), finished=Sum('finished')).order_by(*columns)
+        totals = buckets.aggregate(opened=Sum('opened', default=0), finished=Sum('finished', default=0))
+        return Response({'start': start, 'end': end, 'totals': totals, 'days': list(days)})
 
-class ContributorViewSet(viewsets.ModelViewSet):
+    def parse_date(self, name, default):
+        value = self.request.query_params.get(name)
+        if not value:
+            return default
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise ValidationError({name: 'Expected a YYYY-MM-DD date.'})
+
+class ContributorViewSet(ShardedViewMixin, DynamicFieldsViewMixin, viewsets.ModelViewSet):
     """
     CRUD API for Contributors.
     - Project author can add/remove contributors
-    - Authenticated users can view contributors
+    - Project members can view the contributors of their projects
+    - ``?fields=`` trims the payload, ``?expand=`` inlines related objects
     """
 
     queryset = Contributor.objects.all()
@@ -45,19 +238,23 @@ class ContributorViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Filter contributors by project if project_id is provided."""
-        queryset = Contributor.objects.all()
+        user = self.request.user
+        queryset = Contributor.objects.with_roles(user) if user.is_staff else Contributor.objects.visible_to(user)
         project_id = self.request.query_params.get('project_id')
         if project_id:
             queryset = queryset.filter(project_id=project_id)
         return queryset
 
 
-class IssueViewSet(viewsets.ModelViewSet):
+class IssueViewSet(IdempotentCreateMixin, ShardedViewMixin, DynamicFieldsViewMixin, viewsets.ModelViewSet):
     """
     CRUD API for Issues.
     - Issue author can update/delete their own issues
     - Project author and contributors can read issues
     - Only project members can create/read issues in a project
+    - POST accepts an ``Idempotency-Key`` header, retries replay the first response
+    - Archived issues are hidden unless ``?archived=true`` is passed (read-only)
+    - ``?fields=`` trims the payload, ``?expand=`` inlines related objects
     """
 
     queryset = Issue.objects.all()
@@ -69,22 +266,22 @@ class IssueViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        issues = Issue.all_objects.filter(archived_time__isnull=False) if wants_archived(self.request) else Issue.objects.all()
         
         if user.is_staff:
-            return Issue.objects.all()
-        
-        authored = Project.objects.filter(author=user)
-        contributed = Project.objects.filter(contributors__user=user)
-        user_issues = (authored | contributed).distinct()
+            return issues.with_roles(user)
 
-        return Issue.objects.filter(project__in=user_issues)
+        return issues.visible_to(user)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(IdempotentCreateMixin, ShardedViewMixin, DynamicFieldsViewMixin, viewsets.ModelViewSet):
     """
     CRUD API for Comments.
     - Comment author can update/delete their own comments
     - Only project members can view/create comments on issues
+    - POST accepts an ``Idempotency-Key`` header, retries replay the first response
+    - Archived comments are hidden unless ``?archived=true`` is passed (read-only)
+    - ``?fields=`` trims the payload, ``?expand=`` inlines related objects
     """
 
     queryset = Comment.objects.all()
@@ -96,17 +293,67 @@ class CommentViewSet(viewsets.ModelViewSet):
         Filter comments to only show those from projects where user is a member.
         """
         user = self.request.user
+        comments = Comment.all_objects.filter(archived_time__isnull=False) if wants_archived(self.request) else Comment.objects.all()
 
         if user.is_staff:
-            return Comment.objects.all()
-        
-        authored = Project.objects.filter(author=user)
-        contributed = Project.objects.filter(contributors__user=user)
-        user_projects = (authored | contributed).distinct()
+            return comments.with_roles(user)
 
-        return Comment.objects.filter(issue__project__in=user_projects)
+        return comments.visible_to(user)
         
 
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+
+
+class MyWorkPagination(CursorPagination):
+    """Keyset pagination, newest issues first: deep pages cost the same as the first one."""
+
+    ordering = ('-created_time', '-id')
+
+
+class MyWorkViewSet(ShardedViewMixin, DynamicFieldsViewMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    "My work": the user's issues across all their projects.
+    - ``?role=assigned`` (default) issues assigned to the user, ``?role=authored`` issues they wrote
+    - Open issues by default, ``?status=`` and ``?priority=`` filter (comma separated values)
+    - Cursor (keyset) paginated, responses cached per user for ``MY_WORK_CACHE_TIMEOUT`` seconds:
+      a plain TTL cache, changes may show up that late (see projects.signals.invalidate_my_work)
+    - ``?fields=`` trims the payload, ``?expand=`` inlines related objects
+    """
+
+    serializer_class = IssueSerializer
+    pagination_class = MyWorkPagination
+    permission_classes = [IsAuthenticated]
+    relations = {'assigned': 'assigned_issues', 'authored': 'authored_issues'}
+
+    def get_queryset(self):
+        user = self.request.user
+        role = self.request.query_params.get('role', 'assigned')
+        if role not in self.relations:
+            raise ValidationError({'role': f"Expected one of: {', '.join(self.relations)}."})
+
+        # Reverse relation of users.User, served by the (assignee, status, priority) index
+        issues = getattr(user, self.relations[role]).visible_to(user)
+
+        statuses = parse_list_param(self.request, 'status')
+        issues = issues.filter(status__in=statuses) if statuses else issues.exclude(status='Finished')
+        priorities = parse_list_param(self.request, 'priority')
+        if priorities:
+            issues = issues.filter(priority__in=priorities)
+        return issues
+
+    def list(self, request, *args, **kwargs):
+        user_id = request.user.pk
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        key = f"my-work:{user_id}:{get_my_work_generation(user_id)}:{path}"
+
+        data = cache.get(key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(key, data, settings.MY_WORK_CACHE_TIMEOUT)
+
+        response = Response(data)
+        patch_cache_control(response, private=True, max_age=settings.MY_WORK_CACHE_TIMEOUT)
+        patch_vary_headers(response, ('Authorization',))
+        return response
@@ -0,0 +1,97 @@
+"""
+HTTP middlewares of the SoftDesk API.
+"""
+
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # Optional dependency, gzip only without it
+    brotli = None
+
+re_accepts_gzip = _lazy_re_compile(r"\bgzip\b")
+re_accepts_brotli = _lazy_re_compile(r"\bbr\b")
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress responses with brotli (when the ``brotli`` package is installed
+    and the client accepts it) or gzip.
+
+    - Responses smaller than ``COMPRESSION_MIN_SIZE`` bytes are sent as is
+    - Streaming responses are compressed chunk by chunk
+    - The compressed body is only kept when it is actually smaller
+    """
+
+    def process_response(self, request, response):
+        min_size = getattr(settings, "COMPRESSION_MIN_SIZE", 200)
+        if not response.streaming and len(response.content) < min_size:
+            return response
+
+        # Avoid compressing twice
+        if response.has_header("Content-Encoding"):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = self.select_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                # Async streams are left to the ASGI server
+                return response
+            response.streaming_content = self.compress_stream(response.streaming_content, encoding)
+            # Compressed size is unknown until streamed
+            del response.headers["Content-Length"]
+        else:
+            compressed_content = self.compress(response.content, encoding)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers["Content-Length"] = str(len(response.content))
+
+        # A strong ETag no longer matches the encoded bytes (RFC 9110 Section 8.8.1)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response.headers["ETag"] = "W/" + etag
+        response.headers["Content-Encoding"] = encoding
+
+        return response
+
+    @staticmethod
+    def select_encoding(request):
+        """Return the preferred encoding accepted by the client, or None."""
+        accept_encoding = request.META.get("HTTP_ACCEPT_ENCODING", "")
+        if brotli is not None and re_accepts_brotli.search(accept_encoding):
+            return "br"
+        if re_accepts_gzip.search(accept_encoding):
+            return "gzip"
+        return None
+
+    def compress(self, content, encoding):
+        if encoding == "br":
+            return brotli.compress(content, quality=getattr(settings, "COMPRESSION_BROTLI_QUALITY", 5))
+        return compress_string(content, max_random_bytes=self.max_random_bytes)
+
+    def compress_stream(self, sequence, encoding):
+        if encoding == "br":
+            return self.brotli_sequence(sequence)
+        return compress_sequence(sequence, max_random_bytes=self.max_random_bytes)
+
+    @staticmethod
+    def brotli_sequence(sequence):
+        """Brotli counterpart of ``django.utils.text.compress_sequence``."""
+        compressor = brotli.Compressor(quality=getattr(settings, "COMPRESSION_BROTLI_QUALITY", 5))
+        for item in sequence:
+            data = compressor.process(item)
+            # Flush so every chunk reaches the client without waiting for the next one
+            data += compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
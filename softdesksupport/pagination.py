@@ -0,0 +1,52 @@
+"""
+Paginator for admin changelists of large tables.
+"""
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using the planner's row estimate instead of ``COUNT(*)`` for
+    unfiltered querysets on large tables.
+
+    The estimate comes from the database statistics (PostgreSQL ``pg_class``,
+    MySQL ``information_schema``). Below ``exact_count_threshold`` rows, when
+    the queryset is filtered, or on databases without statistics (SQLite),
+    the exact count is used.
+    """
+
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        query = getattr(queryset, "query", None)
+        if query is None or query.where:
+            return super().count
+
+        estimate = self.estimate_rows(queryset.db, queryset.model._meta.db_table)
+        if estimate is None or estimate < self.exact_count_threshold:
+            return super().count
+        return estimate
+
+    @staticmethod
+    def estimate_rows(alias, table):
+        """Return the estimated number of rows of ``table``, or None if unknown."""
+        connection = connections[alias]
+        if connection.vendor == "postgresql":
+            sql = "SELECT reltuples::bigint FROM pg_class WHERE relname = %s"
+        elif connection.vendor == "mysql":
+            sql = ("SELECT table_rows FROM information_schema.tables "
+                   "WHERE table_schema = DATABASE() AND table_name = %s")
+        else:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+        # PostgreSQL reports -1 for never analyzed tables
+        if row is None or row[0] is None or row[0] < 0:
+            return None
+        return int(row[0])
@@ -0,0 +1,178 @@
+"""
+On-demand request profiling, usable in production (no DEBUG needed).
+
+A request is profiled when a staff user sends the ``X-Profile: 1`` header,
+or at random with probability ``PROFILING_SAMPLE_RATE``. The profile holds
+the cProfile statistics and the SQL queries of the request, those run by
+the shard pool threads included (projects.sharding.fan_out). The last
+``PROFILING_BUFFER_SIZE`` profiles are kept in memory (per process) and
+served to staff users by ``/api/profiles/``.
+"""
+
+import cProfile
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404
+from django.utils import timezone
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from projects import sharding
+from users.authentication import RevocationJWTAuthentication
+
+
+class ProfileStore:
+    """Bounded ring buffer of the most recent profiles."""
+
+    def __init__(self, size):
+        self.profiles = deque(maxlen=size)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def add(self, profile):
+        with self.lock:
+            profile['id'] = next(self.ids)
+            self.profiles.append(profile)
+        return profile['id']
+
+    def all(self):
+        with self.lock:
+            return list(reversed(self.profiles))
+
+    def get(self, profile_id):
+        with self.lock:
+            return next((profile for profile in self.profiles if profile['id'] == profile_id), None)
+
+
+profile_store = ProfileStore(getattr(settings, 'PROFILING_BUFFER_SIZE', 50))
+
+
+class QueryRecorder:
+    """Database execute wrapper recording each query and its duration."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            # list.append is atomic: shard pool threads record concurrently
+            self.queries.append({
+                'database': context['connection'].alias,
+                'sql': sql,
+                'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+class ProfilingMiddleware:
+    """Profile the requests asked by staff users (``X-Profile: 1``) or sampled."""
+
+    header = 'X-Profile'
+    excluded_prefix = '/api/profiles/'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user = self.should_profile(request)
+        if user is False:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        recorder = QueryRecorder()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            token = sharding.execute_wrappers.set((*sharding.execute_wrappers.get(), recorder))
+            stack.callback(sharding.execute_wrappers.reset, token)
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiler is active in this thread, run unprofiled
+                return self.get_response(request)
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - start
+
+        profile_id = profile_store.add({
+            'time': timezone.now(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'user': getattr(user, 'pk', None),
+            'duration_ms': round(duration * 1000, 3),
+            'query_count': len(recorder.queries),
+            'queries': recorder.queries,
+            'stats': self.format_stats(profiler),
+        })
+        response.headers['X-Profile-Id'] = str(profile_id)
+        return response
+
+    def should_profile(self, request):
+        """Return the requesting user (None if unknown) when profiling, False otherwise."""
+        if request.path.startswith(self.excluded_prefix):
+            return False
+        if request.headers.get(self.header) == '1':
+            user = self.get_user(request)
+            if user is not None and user.is_staff:
+                return user
+        if random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 0):
+            return None
+        return False
+
+    @staticmethod
+    def get_user(request):
+        """User of the session (admin) or of the JWT (API), checked before the view runs."""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user
+        try:
+            authenticated = RevocationJWTAuthentication().authenticate(request)
+        except Exception:
+            # Invalid credentials are reported by the view itself
+            return None
+        return authenticated[0] if authenticated else None
+
+    @staticmethod
+    def format_stats(profiler):
+        stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats('cumulative').print_stats(getattr(settings, 'PROFILING_TOP_FUNCTIONS', 40))
+        return stream.getvalue()
+
+
+class ProfileListView(APIView):
+    """Staff only: summaries of the recent profiles, newest first."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        summary_fields = ('id', 'time', 'method', 'path', 'status', 'user', 'duration_ms', 'query_count')
+        return Response([{name: profile[name] for name in summary_fields} for profile in profile_store.all()])
+
+
+class ProfileDetailView(APIView):
+    """Staff only: one profile with its SQL queries and cProfile statistics."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, pk, *args, **kwargs):
+        profile = profile_store.get(pk)
+        if profile is None:
+            raise Http404
+        return Response(profile)
@@ -0,0 +1,90 @@
+"""
+JSON renderer and parser backed by ``orjson``.
+
+Enable them in ``REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']`` /
+``['DEFAULT_PARSER_CLASSES']``. They produce the output of DRF's
+``JSONRenderer`` / accept the input of ``JSONParser``: dates, times and
+decimals go through the same encoder, NaN and Infinity are refused in
+``STRICT_JSON`` mode. Without ``orjson`` installed, or for what orjson
+cannot do (pretty printing, ASCII or non compact output, non UTF-8
+bodies), DRF's classes are used.
+"""
+
+import math
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # Optional dependency, falls back to the json module
+    orjson = None
+
+
+def has_non_finite_float(data):
+    """True if ``data`` holds a NaN or infinite float, in nested dicts, lists and tuples included."""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                return True
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Render JSON with orjson when available (compact output only)."""
+
+    options = (orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+               if orjson is not None else 0)
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # orjson only knows a fixed 2 spaces indent, pretty printing stays on json
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # orjson writes NaN and Infinity as null, json refuses them in strict mode
+        if self.strict and has_non_finite_float(data):
+            raise ValueError("Out of range float values are not JSON compliant")
+
+        try:
+            # Dates and times through the encoder, for DRF's format (e.g. 'Z' for UTC)
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            # e.g. integers above 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Keep the output a strict javascript subset, like JSONRenderer
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class FastJSONParser(JSONParser):
+    """Parse JSON request bodies with orjson when available."""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+
+        # Same encoding as JSONParser: the request's, from its Content-Type charset
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if encoding.lower() not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            # orjson rejects NaN/Infinity, like JSONParser in strict mode
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,14 +46,26 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'softdesksupport.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'softdesksupport.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Response compression (brotli when installed, gzip otherwise)
+COMPRESSION_MIN_SIZE = 1024  # bytes, smaller bodies are not worth compressing
+COMPRESSION_BROTLI_QUALITY = 5
+
+# Request profiling (softdesksupport.profiling): staff users send "X-Profile: 1",
+# a fraction of all requests can also be sampled. Profiles are read at /api/profiles/
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_BUFFER_SIZE = 50  # profiles kept in memory, per process
+PROFILING_TOP_FUNCTIONS = 40  # functions listed in the cProfile statistics
+
 ROOT_URLCONF = 'softdesksupport.urls'
 
 TEMPLATES = [
@@ -83,6 +96,48 @@ DATABASES = {
     }
 }
 
+# Databases holding the projects and their rows (projects.sharding), default first.
+# SOFTDESK_PROJECT_SHARDS=3 adds two SQLite shards, to try sharding locally.
+PROJECT_SHARDS = ['default']
+for number in range(1, int(os.environ.get('SOFTDESK_PROJECT_SHARDS', 1))):
+    PROJECT_SHARDS.append(f'shard{number}')
+    DATABASES[f'shard{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_shard{number}.sqlite3',
+        # Kept open by the fan-out threads between requests
+        'CONN_MAX_AGE': 60,
+    }
+
+# Threads running a query on every shard (lists spanning several shards), one per shard by default
+PROJECT_SHARD_WORKERS = None
+
+DATABASE_ROUTERS = ['projects.sharding.ProjectShardRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'softdesk',
+    }
+}
+
+# Seconds a compact user representation stays cached (bulk lookups by ID)
+USER_CACHE_TIMEOUT = 300
+
+# Characters of description_preview in list responses (full text on retrieve)
+DESCRIPTION_PREVIEW_LENGTH = 200
+
+# Seconds a "my work" page stays cached, i.e. how stale it may be. Saving an issue
+# or a contributor drops the user's pages early, in the process's own cache only
+MY_WORK_CACHE_TIMEOUT = 60
+
+# Seconds a POST response stays replayable through its Idempotency-Key header
+# (projects.models.IdempotencyKey, purged by the purge_idempotency_keys command)
+IDEMPOTENCY_KEY_TTL = 24 * 3600
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -130,24 +185,64 @@ AUTH_USER_MODEL = 'users.User'
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.RevocationJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # orjson backed, fall back to DRF's JSON renderer/parser when orjson is missing
+    'DEFAULT_RENDERER_CLASSES': (
+        'softdesksupport.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'softdesksupport.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # Token bucket throttles, see softdesksupport/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': (
+        'softdesksupport.throttling.UserBucketThrottle',
+        'softdesksupport.throttling.WriteBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'user': '300/min',   # per client and endpoint class
+        'write': '60/min',   # POST/PUT/PATCH/DELETE, per client
+        'login': '10/min',   # /api/token/, per IP address
+    },
+    # Reverse proxies in front of the app: clients are identified by REMOTE_ADDR
+    # (0) rather than by X-Forwarded-For, which any client can set. Raise it
+    # to the number of trusted proxies when deployed behind some.
+    'NUM_PROXIES': 0,
+    # 409 Conflict for concurrent updates (projects.models.StaleObjectError)
+    'EXCEPTION_HANDLER': 'projects.views.exception_handler',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10
 }
 
+# Bucket store of the throttles: LocalMemoryBucketStore (per process)
+# or CacheBucketStore (shared through the THROTTLE_CACHE_ALIAS cache)
+THROTTLE_BUCKET_STORE = 'softdesksupport.throttling.LocalMemoryBucketStore'
+
 # SimpleJWT Configuration
 from datetime import timedelta
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(hours=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
-    'ROTATE_REFRESH_TOKENS': False,
-    'BLACKLIST_AFTER_ROTATION': False,
+    'ROTATE_REFRESH_TOKENS': True,
+    # Handled by users.revocation instead of the token_blacklist app
+    'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'users.authentication.RevocationTokenRefreshSerializer',
     'UPDATE_LAST_LOGIN': False,
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
-}
\ No newline at end of file
+}
+
+# Revoked tokens (users.revocation): seconds between two pulls of new
+# revocations from the database, and between two purges of expired rows.
+# Each pull re-reads the rows of the last REVOCATION_SYNC_OVERLAP seconds
+# (transactions committing after a newer row was read).
+REVOCATION_SYNC_INTERVAL = 5
+REVOCATION_SYNC_OVERLAP = 60
+REVOCATION_PRUNE_INTERVAL = 3600
@@ -0,0 +1,160 @@
+import gzip
+import os
+import uuid
+from datetime import date, datetime, time, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock, skipIf
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from softdesksupport import middleware, profiling, renderers, throttling
+from softdesksupport.middleware import CompressionMiddleware
+from softdesksupport.renderers import FastJSONParser, FastJSONRenderer
+from users.models import User
+
+
+@skipIf(renderers.orjson is None, "orjson is not installed")
+class FastJSONTests(SimpleTestCase):
+    """The orjson renderer and parser behave like DRF's JSONRenderer and JSONParser."""
+
+    def test_same_output_as_json_renderer(self):
+        data = {
+            'datetime': datetime(2026, 10, 19, 17, 30, 5, 120, tzinfo=dt_timezone.utc),
+            'date': date(2026, 10, 19),
+            'time': time(8, 15),
+            'decimal': Decimal('1.50'),
+            'uuid': uuid.UUID(int=1),
+            'text': 'é ',
+            'nested': [1, 2.5, None, True, {'key': ()}],
+            7: 'integer key',
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_non_finite_floats_are_refused(self):
+        for value in (float('nan'), float('inf')):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                FastJSONRenderer().render({'values': [1, {'value': value}]})
+
+    def test_pretty_printing_falls_back(self):
+        rendered = FastJSONRenderer().render({'a': 1}, 'application/json; indent=4')
+        self.assertEqual(rendered, b'{\n    "a": 1\n}')
+
+    def parse(self, body, parser_context=None):
+        return FastJSONParser().parse(BytesIO(body), 'application/json', parser_context or {})
+
+    def test_parser(self):
+        self.assertEqual(self.parse('{"name": "é"}'.encode()), {'name': 'é'})
+        for body in (b'{"value": NaN}', b'{"value": Infinity}', b'{'):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                self.parse(body)
+
+    def test_parser_charsets(self):
+        body = '{"name": "é"}'.encode('latin-1')
+        context = {'encoding': 'latin-1'}
+        self.assertEqual(self.parse(body, context), JSONParser().parse(BytesIO(body), 'application/json', context))
+        self.assertEqual(self.parse(body, context), {'name': 'é'})
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Responses are compressed with brotli or gzip when it is worth it."""
+
+    body = b'{"name": "compressible"}' * 20
+
+    def get(self, response, accept_encoding='gzip'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_gzip(self):
+        response = self.get(HttpResponse(self.body))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    @skipIf(middleware.brotli is None, "brotli is not installed")
+    def test_brotli_is_preferred(self):
+        response = self.get(HttpResponse(self.body), 'gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(middleware.brotli.decompress(response.content), self.body)
+
+    def test_not_accepted(self):
+        response = self.get(HttpResponse(self.body), 'identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.body)
+
+    def test_small_responses_are_left_alone(self):
+        response = self.get(HttpResponse(self.body[:99]))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_incompressible_responses_are_left_alone(self):
+        body = os.urandom(1000)
+        response = self.get(HttpResponse(body))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, body)
+
+    def test_streaming(self):
+        response = self.get(StreamingHttpResponse(iter([self.body, self.body])))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.body * 2)
+
+    def test_strong_etag_becomes_weak(self):
+        response = HttpResponse(self.body)
+        response['ETag'] = '"v1"'
+        self.assertEqual(self.get(response)['ETag'], 'W/"v1"')
+
+
+@override_settings(PROFILING_SAMPLE_RATE=0)
+class ProfilingTests(TestCase):
+    """Staff users profile their requests with ``X-Profile: 1`` and read the profiles back."""
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        patcher = mock.patch.object(profiling, 'profile_store', profiling.ProfileStore(3))
+        self.store = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.user = User.objects.create_user('user', password='x')
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(user).access_token}')
+        return client
+
+    def test_staff_requests_are_profiled(self):
+        client = self.client_for(self.staff)
+        response = client.get('/api/users/', HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        profile = client.get(f"/api/profiles/{response['X-Profile-Id']}/").json()
+        self.assertEqual((profile['path'], profile['status'], profile['user']), ('/api/users/', 200, self.staff.pk))
+        self.assertEqual(profile['query_count'], len(profile['queries']))
+        self.assertIn('cumulative', profile['stats'])
+        self.assertFalse(client.get('/api/users/').has_header('X-Profile-Id'))
+
+    def test_header_ignored_for_other_users(self):
+        response = self.client_for(self.user).get('/api/users/', HTTP_X_PROFILE='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(self.store.all(), [])
+
+    def test_buffer_keeps_the_latest_profiles(self):
+        client = self.client_for(self.staff)
+        ids = [int(client.get('/api/users/', HTTP_X_PROFILE='1')['X-Profile-Id']) for _ in range(5)]
+        listed = client.get('/api/profiles/').json()
+        self.assertEqual([profile['id'] for profile in listed], ids[:1:-1])
+        self.assertEqual(client.get(f'/api/profiles/{ids[0]}/').status_code, 404)
+
+    def test_profiles_are_staff_only(self):
+        profile_id = self.client_for(self.staff).get('/api/users/', HTTP_X_PROFILE='1')['X-Profile-Id']
+        client = self.client_for(self.user)
+        for url in ('/api/profiles/', f'/api/profiles/{profile_id}/'):
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 403)
@@ -0,0 +1,174 @@
+"""
+Token bucket throttling.
+
+Each throttle scope owns a bucket per client holding up to ``num_requests``
+tokens, refilled continuously at ``num_requests / period``. A request takes
+one token; when the bucket is empty the request is throttled and DRF answers
+429 with a ``Retry-After`` header.
+
+Buckets live in a bucket store, chosen with the ``THROTTLE_BUCKET_STORE``
+setting (dotted path). The default ``LocalMemoryBucketStore`` is per process
+and lock protected; ``CacheBucketStore`` shares buckets between processes
+through the Django cache (e.g. Redis or Memcached).
+"""
+
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class BaseBucketStore:
+    """Storage of token buckets, as ``key -> (tokens, last refill time)``."""
+
+    timer = time.monotonic
+
+    def consume(self, key, capacity, duration):
+        """
+        Take one token from the bucket ``key`` (``capacity`` tokens refilled every ``duration`` seconds).
+
+        Returns 0 when the request is allowed, otherwise the seconds until a token is available.
+        """
+        raise NotImplementedError('.consume() must be overridden')
+
+    def take(self, bucket, now, capacity, duration):
+        """Refill then take a token from ``bucket``; return ``(new bucket, wait)``."""
+        tokens, last = bucket if bucket is not None else (capacity, now)
+        tokens = min(capacity, tokens + (now - last) * capacity / duration)
+        if tokens >= 1:
+            return (tokens - 1, now), 0
+        return (tokens, now), (1 - tokens) * duration / capacity
+
+
+class LocalMemoryBucketStore(BaseBucketStore):
+    """Process local store, the fastest option for a single server."""
+
+    # Above this size, full (hence useless) buckets are dropped
+    max_entries = 10000
+
+    def __init__(self):
+        self.buckets = {}
+        self.expiry = {}
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, duration):
+        now = self.timer()
+        with self.lock:
+            self.buckets[key], wait = self.take(self.buckets.get(key), now, capacity, duration)
+            # A bucket is full again after at most one duration
+            self.expiry[key] = now + duration
+            if len(self.buckets) > self.max_entries:
+                self.prune(now)
+        return wait
+
+    def prune(self, now):
+        for key in [key for key, expires in self.expiry.items() if expires <= now]:
+            del self.buckets[key]
+            del self.expiry[key]
+
+
+class CacheBucketStore(BaseBucketStore):
+    """
+    Store shared through a Django cache (``THROTTLE_CACHE_ALIAS``, default cache by default).
+
+    The read-modify-write is not atomic: concurrent requests of the same
+    client may occasionally get an extra token, which is fine for throttling.
+    """
+
+    # Wall clock, buckets are shared between machines
+    timer = time.time
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+    def consume(self, key, capacity, duration):
+        now = self.timer()
+        bucket, wait = self.take(self.cache.get(key), now, capacity, duration)
+        self.cache.set(key, bucket, math.ceil(duration))
+        return wait
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bucket_store():
+    """Return the process wide bucket store configured by ``THROTTLE_BUCKET_STORE``."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                path = getattr(settings, 'THROTTLE_BUCKET_STORE', 'softdesksupport.throttling.LocalMemoryBucketStore')
+                _store = import_string(path)()
+    return _store
+
+
+def reset_bucket_store():
+    """Drop the process wide bucket store, the next request builds a new one (used by tests)."""
+    global _store
+    with _store_lock:
+        _store = None
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    Base token bucket throttle; rates come from ``DEFAULT_THROTTLE_RATES[scope]``
+    with the usual ``'number/period'`` syntax. Subclasses set ``scope`` and ``get_cache_key()``.
+    """
+
+    cache_format = 'bucket_%(scope)s_%(ident)s'
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.retry_after = get_bucket_store().consume(self.key, self.num_requests, self.duration)
+        return self.retry_after == 0
+
+    def wait(self):
+        # Whole seconds, rounded up so Retry-After never says 0
+        return math.ceil(self.retry_after)
+
+    def get_client_ident(self, request):
+        if request.user and request.user.is_authenticated:
+            return f'user{request.user.pk}'
+        return self.get_ident(request)
+
+
+class UserBucketThrottle(TokenBucketThrottle):
+    """General budget, per client and per endpoint class (scope ``user``)."""
+
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        ident = f'{self.get_client_ident(request)}_{view.__class__.__name__}'
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class WriteBucketThrottle(TokenBucketThrottle):
+    """Budget shared by all write requests (POST/PUT/PATCH/DELETE) of a client (scope ``write``)."""
+
+    scope = 'write'
+
+    def get_cache_key(self, request, view):
+        if request.method in SAFE_METHODS:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_client_ident(request)}
+
+
+class LoginBucketThrottle(TokenBucketThrottle):
+    """Budget of the login endpoint, per IP address (scope ``login``)."""
+
+    scope = 'login'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
@@ -17,11 +17,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework import routers
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.views import TokenRefreshView
 
-from users.views import UserAPIView
+from softdesksupport.profiling import ProfileDetailView, ProfileListView
+from users.views import LoginView, LogoutView, UserAPIView
 from users.views import UserViewset
-from projects.views import ProjectViewSet, ContributorViewSet, IssueViewSet, CommentViewSet
+from projects.views import ProjectViewSet, ContributorViewSet, IssueViewSet, CommentViewSet, MyWorkViewSet
 
 router = routers.SimpleRouter()
 router.register('user', UserViewset, basename='user')
@@ -29,11 +30,16 @@ router.register('projects', ProjectViewSet, basename='project')
 router.register('contributors', ContributorViewSet, basename='contributor')
 router.register('issues', IssueViewSet, basename='issue')
 router.register('comments', CommentViewSet, basename='comment')
+router.register('my-work', MyWorkViewSet, basename='my-work')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api-auth/', include('rest_framework.urls')),
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', LoginView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/revoke/', LogoutView.as_view(), name='token_revoke'),
+    path('api/profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('api/profiles/<int:pk>/', ProfileDetailView.as_view(), name='profile-detail'),
+    path('api/users/', UserAPIView.as_view(), name='user-list-compact'),
     path('api/', include(router.urls))
 ]
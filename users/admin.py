@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 
+from softdesksupport.pagination import EstimatedCountPaginator
 from .models import User
 
 
@@ -21,6 +22,12 @@ class UserAdmin(BaseUserAdmin):
 		"can_data_be_shared",
 	)
 
+	# Large table: estimated counts and case-sensitive prefix search on the unique
+	# (indexed) username, also used by the autocomplete widgets of the projects admin
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+	search_fields = ("username__startswith",)
+
 	# Add custom fields into the user detail edit page
 	fieldsets = (
 		(None, {"fields": ("username", "password")}),
@@ -0,0 +1,42 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.revocation import revocation_store
+
+
+def check_not_revoked(token):
+    """Raise ``InvalidToken`` if ``token`` was revoked."""
+    if revocation_store.is_revoked(token[api_settings.JTI_CLAIM]):
+        raise InvalidToken(_("Token is revoked"))
+
+
+class RevocationJWTAuthentication(JWTAuthentication):
+    """JWT authentication rejecting revoked access tokens (in-memory check, no query)."""
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        check_not_revoked(token)
+        return token
+
+
+class RevocationTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refresh serializer rejecting revoked refresh tokens.
+
+    With ``ROTATE_REFRESH_TOKENS`` and ``BLACKLIST_AFTER_ROTATION`` enabled,
+    the refresh token just used is revoked so it cannot be replayed. This
+    replaces simplejwt's ``token_blacklist`` app.
+    """
+
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs["refresh"])
+        check_not_revoked(refresh)
+        if api_settings.ROTATE_REFRESH_TOKENS and api_settings.BLACKLIST_AFTER_ROTATION:
+            # Revoke before issuing the new pair: of two concurrent refreshes
+            # with the same token, only the one inserting the row succeeds
+            if not revocation_store.revoke(refresh[api_settings.JTI_CLAIM], refresh["exp"]):
+                raise InvalidToken(_("Token is revoked"))
+        return super().validate(attrs)
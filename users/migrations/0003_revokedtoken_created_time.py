@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:02
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='revokedtoken',
+            name='created_time',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class User(AbstractUser):
@@ -11,3 +12,16 @@ class User(AbstractUser):
     age = models.PositiveIntegerField(blank=True, null=True)
     can_be_contacted = models.BooleanField(default=False)
     can_data_be_shared = models.BooleanField(default=False)
+
+
+class RevokedToken(models.Model):
+    """Revoked JWT, identified by its ``jti``.
+
+    Kept until the token expires; read in bulk by the in-memory
+    ``users.revocation.RevocationStore`` rather than on every request."""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_time = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return self.jti
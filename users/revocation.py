@@ -0,0 +1,101 @@
+"""In-memory view of the revoked JWTs.
+
+Checking a token against the ``RevokedToken`` table on every request (as
+simplejwt's ``token_blacklist`` app does) costs a query per call. The store
+below keeps the revoked ``jti`` values of the current process in a set,
+paired with a heap sorted by expiry:
+
+- ``is_revoked`` is a set lookup, expired entries are popped from the heap
+- new rows written by other processes are pulled incrementally at most
+  every ``REVOCATION_SYNC_INTERVAL`` seconds: rows created since the last
+  pull, minus ``REVOCATION_SYNC_OVERLAP`` seconds, so rows committed late
+  (out of order IDs or timestamps) are still seen
+- expired rows are deleted from the table every ``REVOCATION_PRUNE_INTERVAL``
+  seconds, expired tokens are rejected by their signature check anyway
+"""
+
+import heapq
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from users.models import RevokedToken
+
+
+class RevocationStore:
+    """Process local cache of ``RevokedToken``, see the module docstring."""
+
+    timer = time.monotonic
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything, the next check reloads from the database."""
+        self.revoked = {}     # jti -> expiry timestamp
+        self.expiries = []    # heap of (expiry timestamp, jti)
+        self.synced_at = None
+        self.next_sync = 0
+        self.next_prune = 0
+
+    def is_revoked(self, jti):
+        """Return True if the token ``jti`` was revoked."""
+        self.sync()
+        return jti in self.revoked
+
+    def revoke(self, jti, exp):
+        """
+        Revoke token ``jti`` until its ``exp`` claim (epoch seconds).
+        Return False if it was already revoked (by this or another process).
+        """
+        try:
+            with transaction.atomic():
+                RevokedToken.objects.create(jti=jti, expires_at=datetime_from_epoch(exp))
+        except IntegrityError:
+            created = False
+        else:
+            created = True
+        with self.lock:
+            self.add(jti, exp)
+        return created
+
+    def add(self, jti, exp):
+        if jti not in self.revoked:
+            self.revoked[jti] = exp
+            heapq.heappush(self.expiries, (exp, jti))
+
+    def sync(self, force=False):
+        """Drop expired entries and pull revocations made by other processes."""
+        now = self.timer()
+        with self.lock:
+            self.expire(time.time())
+            if not force and now < self.next_sync:
+                return
+            self.next_sync = now + getattr(settings, "REVOCATION_SYNC_INTERVAL", 5)
+
+            current_time = timezone.now()
+            rows = RevokedToken.objects.filter(expires_at__gt=current_time)
+            if self.synced_at is not None:
+                overlap = timedelta(seconds=getattr(settings, "REVOCATION_SYNC_OVERLAP", 60))
+                rows = rows.filter(created_time__gte=self.synced_at - overlap)
+            for jti, expires_at in rows.values_list("jti", "expires_at"):
+                self.add(jti, expires_at.timestamp())
+            self.synced_at = current_time
+
+            if now >= self.next_prune:
+                self.next_prune = now + getattr(settings, "REVOCATION_PRUNE_INTERVAL", 3600)
+                RevokedToken.objects.filter(expires_at__lte=current_time).delete()
+
+    def expire(self, timestamp):
+        while self.expiries and self.expiries[0][0] <= timestamp:
+            _, jti = heapq.heappop(self.expiries)
+            self.revoked.pop(jti, None)
+
+
+revocation_store = RevocationStore()
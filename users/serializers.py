@@ -13,4 +13,34 @@ class UserSerializer(ModelSerializer):
             "age", "can_be_contacted", "can_data_be_shared",
         ]
         # Ensure password is accepted on write but never returned in responses.
-        extra_kwargs = {"password": {"write_only": True}}
\ No newline at end of file
+        extra_kwargs = {"password": {"write_only": True}}
+
+
+class UserCompactSerializer(ModelSerializer):
+    """Read-only projection of a user, used to resolve author/assignee IDs.
+
+    Names are only exposed when the user consented to share their data
+    (``can_data_be_shared``). Works on model instances as well as on the
+    dicts returned by ``QuerySet.values()``.
+    """
+
+    # Columns to load with .only()/.values(), consent flag included
+    QUERY_FIELDS = ("id", "username", "first_name", "last_name", "can_data_be_shared")
+    PRIVATE_FIELDS = ("first_name", "last_name")
+
+    class Meta:
+        """Serializer configuration for the compact projection."""
+        model = User
+        fields = ["id", "username", "first_name", "last_name"]
+        read_only_fields = fields
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if isinstance(instance, dict):
+            shared = instance.get("can_data_be_shared", False)
+        else:
+            shared = instance.can_data_be_shared
+        if not shared:
+            for field in self.PRIVATE_FIELDS:
+                data.pop(field, None)
+        return data
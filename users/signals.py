@@ -0,0 +1,17 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import User
+
+
+def compact_cache_key(user_id):
+    """Cache key of the compact representation of a user."""
+    return f"users:compact:{user_id}"
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_compact_user(sender, instance, **kwargs):
+    """Drop the cached compact representation when a user changes."""
+    cache.delete(compact_cache_key(instance.pk))
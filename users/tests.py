@@ -1,3 +1,189 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from softdesksupport import throttling
+from users.models import RevokedToken, User
+from users.revocation import RevocationStore, revocation_store
+
+
+class UserAdminChangelistQueryCountTests(TestCase):
+    """The number of queries of the user changelist must not grow with the number of rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin123')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def count_queries(self, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('admin:users_user_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_changelist_query_count_is_constant(self):
+        few = self.count_queries()
+        User.objects.bulk_create([User(username=f'user{n}') for n in range(20)])
+        self.assertEqual(self.count_queries(), few)
+
+    def test_changelist_prefix_search(self):
+        User.objects.bulk_create([User(username=f'user{n}') for n in range(3)])
+        self.assertEqual(self.count_queries({'q': 'user1'}), self.count_queries({'q': 'nobody'}))
+
+
+class UserCompactTests(TestCase):
+    """/api/users/ lists compact users, ``?ids=`` resolves IDs through a per-user cache."""
+
+    url = '/api/users/'
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        cache.clear()
+        self.client = APIClient()
+        self.sharing = User.objects.create_user('sharing', password='x', first_name='Ada', last_name='L',
+                                                can_data_be_shared=True)
+        self.private = User.objects.create_user('private', password='x', first_name='Bob', last_name='M')
+        self.client.force_authenticate(self.sharing)
+
+    def get_ids(self, ids):
+        return self.client.get(self.url, {'ids': ids})
+
+    def test_pagination(self):
+        User.objects.bulk_create([User(username=f'user{n}') for n in range(10)])
+        page = self.client.get(self.url).json()
+        self.assertEqual(page['count'], 12)
+        self.assertEqual(len(page['results']), 10)
+        self.assertEqual(len(self.client.get(page['next']).json()['results']), 2)
+
+    def test_ids_keep_order_and_drop_duplicates(self):
+        ids = f'{self.private.pk},{self.sharing.pk},{self.private.pk},999'
+        self.assertEqual([user['id'] for user in self.get_ids(ids).json()], [self.private.pk, self.sharing.pk])
+
+    def test_malformed_ids(self):
+        for ids in ('1,a', ','.join(str(n) for n in range(1, 102))):
+            with self.subTest(ids=ids[:10]):
+                self.assertEqual(self.get_ids(ids).status_code, 400)
+        self.assertEqual(self.get_ids(','.join(str(n) for n in range(1, 101))).status_code, 200)
+
+    def test_cached_per_user(self):
+        ids = f'{self.sharing.pk},{self.private.pk}'
+        first = self.get_ids(ids).json()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_ids(ids).json(), first)
+
+        self.sharing.first_name = 'Grace'
+        self.sharing.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_ids(ids).json()[0]['first_name'], 'Grace')
+
+    def test_names_hidden_without_consent(self):
+        sharing, private = self.get_ids(f'{self.sharing.pk},{self.private.pk}').json()
+        self.assertEqual(sharing, {'id': self.sharing.pk, 'username': 'sharing', 'first_name': 'Ada', 'last_name': 'L'})
+        self.assertEqual(private, {'id': self.private.pk, 'username': 'private'})
+        listed = {user['id']: user for user in self.client.get(self.url).json()['results']}
+        self.assertNotIn('first_name', listed[self.private.pk])
+        self.assertEqual(listed[self.sharing.pk]['first_name'], 'Ada')
+
+
+class TokenRevocationTests(TestCase):
+    """Refresh tokens are single use, logout revokes both tokens."""
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        revocation_store.reset()
+        self.client = APIClient()
+        self.user = User.objects.create_user('alice', password='x')
+        self.refresh = RefreshToken.for_user(self.user)
+
+    def refresh_with(self, token):
+        return self.client.post(reverse('token_refresh'), {'refresh': str(token)}, format='json')
+
+    def test_refresh_rotates_and_rejects_replay(self):
+        response = self.refresh_with(self.refresh)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()['refresh'], str(self.refresh))
+        self.assertEqual(self.refresh_with(self.refresh).status_code, 401)
+        self.assertEqual(self.refresh_with(response.json()['refresh']).status_code, 200)
+
+    def test_concurrent_refresh_issues_one_pair(self):
+        self.assertEqual(self.refresh_with(self.refresh).status_code, 200)
+        # Another process, which has not pulled the revocation yet
+        revocation_store.reset()
+        revocation_store.next_sync = float('inf')
+        self.assertEqual(self.refresh_with(self.refresh).status_code, 401)
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        access = self.refresh.access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        self.assertEqual(self.client.get('/api/users/').status_code, 200)
+        response = self.client.post(reverse('token_revoke'), {'refresh': str(self.refresh)}, format='json')
+        self.assertEqual(response.status_code, 205)
+        self.assertEqual(self.client.get('/api/users/').status_code, 401)
+        self.client.credentials()
+        self.assertEqual(self.refresh_with(self.refresh).status_code, 401)
+
+    def test_sync_reads_rows_committed_late(self):
+        store = RevocationStore()
+        store.sync(force=True)
+        # Row created before the last pull but committed after it
+        RevokedToken.objects.create(jti='late', expires_at=timezone.now() + timedelta(hours=1),
+                                    created_time=timezone.now() - timedelta(seconds=30))
+        store.sync(force=True)
+        self.assertTrue(store.is_revoked('late'))
+
+
+class ThrottleTests(TestCase):
+    """Token bucket budgets: login per client address, writes per client, others per client and endpoint."""
+
+    databases = '__all__'
+
+    def setUp(self):
+        throttling.reset_bucket_store()
+        # Frozen clock: no token is refilled while the budget is spent
+        store = throttling.get_bucket_store()
+        store.timer = lambda: 1000.0
+        self.user = User.objects.create_user('alice', password='x')
+
+    def assertThrottled(self, response):
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_login_budget_ignores_forwarded_for(self):
+        url = reverse('token_obtain_pair')
+        for n in range(10):
+            response = self.client.post(url, {'username': 'alice', 'password': 'wrong'},
+                                        HTTP_X_FORWARDED_FOR=f'10.0.0.{n}')
+            self.assertEqual(response.status_code, 401)
+        response = self.client.post(url, {'username': 'alice', 'password': 'x'}, HTTP_X_FORWARDED_FOR='10.0.1.1')
+        self.assertThrottled(response)
+
+    def test_write_budget_is_shared_by_endpoints(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for n in range(60):
+            url = '/api/projects/' if n % 2 else '/api/issues/'
+            self.assertEqual(client.post(url, {}, format='json').status_code, 400)
+        self.assertThrottled(client.post('/api/comments/', {}, format='json'))
+        # Reads only spend the per endpoint budget
+        self.assertEqual(client.get('/api/projects/').status_code, 200)
+        # Other clients have their own budget
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('bob', password='x'))
+        self.assertEqual(other.post('/api/projects/', {}, format='json').status_code, 400)
 
-# Create your tests here.
+    def test_user_budget_is_per_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for _ in range(300):
+            self.assertEqual(client.get('/api/users/').status_code, 200)
+        self.assertThrottled(client.get('/api/users/'))
+        self.assertEqual(client.get('/api/projects/').status_code, 200)
@@ -1,32 +1,132 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import render
-from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
+from rest_framework import status
+from rest_framework.generics import ListAPIView
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
+
+from softdesksupport.throttling import LoginBucketThrottle
 
 from users.models import User
-from users.serializers import UserSerializer
+from users.revocation import revocation_store
+from users.serializers import UserCompactSerializer, UserSerializer
+from users.signals import compact_cache_key
+
+# Upper bound of IDs accepted by a single bulk lookup
+MAX_BULK_IDS = 100
 
-class UserAPIView(APIView):
-    """Read-only endpoint to list users.
+
+class UserAPIView(ListAPIView):
+    """Read-only endpoint to list users with a compact projection.
 
     Methods
     -------
     GET
-        Returns an array of serialized users using ``UserSerializer`` (many=True).
+        Returns a paginated list of users serialized with ``UserCompactSerializer``.
+        Only the projected columns are selected (``.only()``).
+    GET ?ids=1,2,3
+        Bulk resolver for author/assignee IDs. Returns an unpaginated list of
+        the matching users; each representation is cached per ID.
 
     Response
     --------
     200 OK
-        JSON list of user objects with fields defined in ``UserSerializer``.
+        JSON (paginated) list of compact user objects. Names are omitted for
+        users who did not consent to share their data.
+    400 Bad Request
+        ``ids`` is malformed or holds more than ``MAX_BULK_IDS`` values.
     """
 
-    def get(self, *args, **kwargs):
-        """List all users as serialized JSON."""
-        users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data)
+    serializer_class = UserCompactSerializer
+
+    def get_queryset(self):
+        """Return all users, loading only the projected columns."""
+        return User.objects.only(*UserCompactSerializer.QUERY_FIELDS).order_by("id")
+
+    def get(self, request, *args, **kwargs):
+        """List users, or resolve the IDs given in ``?ids=``."""
+        ids = request.query_params.get("ids")
+        if ids is None:
+            return self.list(request, *args, **kwargs)
+        return Response(self.resolve_ids(self.parse_ids(ids)))
+
+    @staticmethod
+    def parse_ids(raw):
+        """Parse a comma separated list of IDs, keeping order and dropping duplicates."""
+        try:
+            ids = list(dict.fromkeys(int(value) for value in raw.split(",") if value.strip()))
+        except ValueError:
+            raise ValidationError({"ids": "Expected a comma separated list of integers."})
+        if len(ids) > MAX_BULK_IDS:
+            raise ValidationError({"ids": f"At most {MAX_BULK_IDS} IDs per request."})
+        return ids
+
+    def resolve_ids(self, ids):
+        """Return compact users for ``ids``, from the cache first then one query for the rest."""
+        keys = {user_id: compact_cache_key(user_id) for user_id in ids}
+        cached = cache.get_many(keys.values())
+        found = {user_id: cached[key] for user_id, key in keys.items() if key in cached}
+
+        missing = [user_id for user_id in ids if user_id not in found]
+        if missing:
+            serializer = self.get_serializer()
+            fresh = {
+                row["id"]: serializer.to_representation(row)
+                for row in User.objects.filter(id__in=missing).values(*UserCompactSerializer.QUERY_FIELDS)
+            }
+            cache.set_many({keys[user_id]: data for user_id, data in fresh.items()},
+                           timeout=settings.USER_CACHE_TIMEOUT)
+            found.update(fresh)
+
+        # Unknown IDs are simply left out
+        return [found[user_id] for user_id in ids if user_id in found]
 # Create your views here.
 
+class LoginView(TokenObtainPairView):
+    """Obtain a JWT pair; throttled with its own per-IP budget (scope ``login``)."""
+
+    throttle_classes = [LoginBucketThrottle]
+
+
+class LogoutView(APIView):
+    """Revoke the JWTs of the caller.
+
+    Methods
+    -------
+    POST
+        Revokes the access token used for the request and, when given in
+        the body, the ``refresh`` token.
+
+    Response
+    --------
+    205 Reset Content
+        Both tokens are rejected from now on.
+    401 Unauthorized
+        The refresh token is invalid.
+    """
+
+    def post(self, request, *args, **kwargs):
+        """Revoke the current access token and the optional refresh token."""
+        raw_refresh = request.data.get("refresh")
+        if raw_refresh:
+            try:
+                refresh = RefreshToken(raw_refresh)
+            except TokenError as exc:
+                raise InvalidToken(exc.args[0])
+            revocation_store.revoke(refresh[jwt_settings.JTI_CLAIM], refresh["exp"])
+
+        if request.auth is not None:
+            revocation_store.revoke(request.auth[jwt_settings.JTI_CLAIM], request.auth["exp"])
+        return Response(status=status.HTTP_205_RESET_CONTENT)
+
+
 class UserViewset(ModelViewSet):
     """CRUD API for users using DRF's ModelViewSet."""
 
@@ -35,4 +135,4 @@ class UserViewset(ModelViewSet):
     def get_queryset(self):
         """Return the base queryset of all users."""
         #return User.objects.all()
-        return User.objects.filter(id=self.request.user.id)
\ No newline at end of file
+        return User.objects.filter(id=self.request.user.id)